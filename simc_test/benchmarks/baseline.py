@@ -0,0 +1,151 @@
+import json
+import math
+import os
+import platform
+import statistics
+
+from simc_test.generator import generate_program
+from simc_test.benchmarks.main import STAGES, benchmark_source
+from simc_test.codetests.cache import get_simc_version
+
+
+def collect_samples(sizes, seed, repeat, warmup):
+    samples = {}
+    for size in sizes:
+        source_code = generate_program(size, seed=seed)
+        size_samples, _ = benchmark_source(
+            source_code, repeat=repeat, warmup=warmup, time_budget=math.inf
+        )
+        for stage in STAGES:
+            samples[f"{stage}@{size}"] = size_samples[stage]
+
+    return samples
+
+
+def rank(values):
+    # Ranks starting from 1, tied values share the mean of their ranks
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2 + 1
+        i = j + 1
+
+    return ranks
+
+
+def mann_whitney_greater(current, baseline):
+    # One sided Mann-Whitney U test, p-value of current being stochastically larger (slower)
+    # than baseline using the normal approximation with tie correction
+    n1, n2 = len(current), len(baseline)
+    values = current + baseline
+    ranks = rank(values)
+
+    u = sum(ranks[:n1]) - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+
+    n = n1 + n2
+    ties = {}
+    for value in values:
+        ties[value] = ties.get(value, 0) + 1
+    tie_correction = sum(t ** 3 - t for t in ties.values()) / (n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_correction))
+    if sigma == 0:
+        return 1.0
+
+    z = (u - mean - 0.5) / sigma
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def update_baseline(baseline_path, sizes=(500, 2000), seed=0, repeat=15, warmup=2):
+    baseline = {
+        "simc_version": get_simc_version(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "sizes": list(sizes),
+        "seed": seed,
+        "samples": collect_samples(sizes, seed, repeat, warmup),
+    }
+
+    with open(baseline_path, "w") as file:
+        json.dump(baseline, file, indent=2)
+        file.write("\n")
+
+    print(f"\033[92mPerformance baseline written to {baseline_path}!\033[m")
+
+
+def compare_samples(baseline_samples, samples, threshold, alpha):
+    # Median of the baseline and current samples, the relative change and the p-value of
+    # every benchmark measured in both, and whether it regressed
+    comparisons = {}
+    for key, key_baseline_samples in baseline_samples.items():
+        if key not in samples:
+            continue
+
+        baseline_median = statistics.median(key_baseline_samples)
+        current_median = statistics.median(samples[key])
+        change = current_median / baseline_median - 1
+        p_value = mann_whitney_greater(samples[key], key_baseline_samples)
+        regressed = change > threshold and p_value < alpha
+        comparisons[key] = (baseline_median, current_median, change, p_value, regressed)
+
+    return comparisons
+
+
+def check_performance(baseline_path, threshold=0.1, alpha=0.01, repeat=15, warmup=2):
+    # A stage regresses when its median slowed down by more than threshold and the
+    # Mann-Whitney test says the slowdown is unlikely to be noise. The program sizes of
+    # regressed stages are measured once more and only a regression which shows up again
+    # counts, a busy moment of the machine rarely lasts through both measurements
+    if not os.path.exists(baseline_path):
+        print(
+            f"\033[91mNo performance baseline at {baseline_path}, create one with "
+            "--perf-check --update-baseline\033[m"
+        )
+        return False
+
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+
+    # Programs of the same sizes and seed as the baseline are measured
+    samples = collect_samples(baseline["sizes"], baseline["seed"], repeat, warmup)
+    comparisons = compare_samples(baseline["samples"], samples, threshold, alpha)
+
+    regressed = [key for key, comparison in comparisons.items() if comparison[-1]]
+    if regressed:
+        print(f"\033[93mMeasuring {', '.join(regressed)} again\033[m")
+        sizes = sorted({int(key.rsplit("@", 1)[1]) for key in regressed})
+        samples = collect_samples(sizes, baseline["seed"], repeat, warmup)
+        regressed_samples = {key: baseline["samples"][key] for key in regressed}
+        comparisons.update(compare_samples(regressed_samples, samples, threshold, alpha))
+
+    print(
+        f"{'Benchmark':<24}{'Baseline (s)':>14}{'Current (s)':>13}{'Change':>9}{'p-value':>10}"
+    )
+
+    passed = True
+    for key, comparison in comparisons.items():
+        baseline_median, current_median, change, p_value, regressed = comparison
+        line = (
+            f"{key:<24}{baseline_median:>14.4f}{current_median:>13.4f}"
+            f"{change:>+9.1%}{p_value:>10.4f}"
+        )
+        if regressed:
+            passed = False
+            print(f"\033[91m{line}\033[m")
+        else:
+            print(f"\033[92m{line}\033[m")
+
+    if passed:
+        print("\033[92mNo stage is slower than the baseline!\033[m")
+    else:
+        print(
+            f"\033[91mSome stages are more than {threshold:.0%} slower than the "
+            f"baseline (p < {alpha}) in two measurements!\033[m"
+        )
+
+    return passed
@@ -0,0 +1,101 @@
+import math
+import statistics
+import time
+
+from simc.symbol_table import SymbolTable
+from simc.parser.simc_parser import parse
+
+from simc_test.generator import generate_program
+from simc_test.pipeline import SourceLexicalAnalyzer, compile_to_string
+
+STAGES = ["lexical_analyze", "parse", "compile"]
+
+
+def run_pipeline_timed(source_code):
+    # Time every stage of the simc pipeline separately, a fresh symbol table is needed
+    # per run as the lexical analyzer and parser fill it
+    table = SymbolTable()
+
+    start = time.perf_counter()
+    tokens, _ = SourceLexicalAnalyzer(source_code, table).lexical_analyze()
+    lexed = time.perf_counter()
+    opcodes = parse(tokens, table)
+    parsed = time.perf_counter()
+    compile_to_string(opcodes, table)
+    compiled = time.perf_counter()
+
+    timings = {
+        "lexical_analyze": lexed - start,
+        "parse": parsed - lexed,
+        "compile": compiled - parsed,
+    }
+
+    return timings, len(tokens)
+
+
+def percentile(samples, percent):
+    # Nearest rank percentile
+    samples = sorted(samples)
+    rank = max(math.ceil(percent / 100 * len(samples)), 1)
+    return samples[rank - 1]
+
+
+def benchmark_source(source_code, repeat=10, warmup=1, time_budget=30):
+    # Stop repeating once the time budget is used up, large inputs are still measured
+    # at least once
+    start = time.perf_counter()
+    for _ in range(warmup):
+        run_pipeline_timed(source_code)
+        if time.perf_counter() - start > time_budget:
+            break
+
+    samples = {stage: [] for stage in STAGES}
+    num_tokens = 0
+    for i in range(repeat):
+        if i > 0 and time.perf_counter() - start > time_budget:
+            break
+
+        timings, num_tokens = run_pipeline_timed(source_code)
+        for stage, timing in timings.items():
+            samples[stage].append(timing)
+
+    return samples, num_tokens
+
+
+def summarize(samples, num_lines, num_tokens):
+    median = statistics.median(samples)
+    return {
+        "runs": len(samples),
+        "median": median,
+        "p95": percentile(samples, 95),
+        "lines_per_sec": num_lines / median if median else math.inf,
+        "tokens_per_sec": num_tokens / median if median else math.inf,
+    }
+
+
+def run_benchmarks(
+    sizes=(1000, 10000, 100000), repeat=10, warmup=1, time_budget=30, seed=0
+):
+    print(
+        f"{'Stage':<16}{'Lines':>8}{'Tokens':>9}{'Runs':>6}{'Median (s)':>12}"
+        f"{'p95 (s)':>10}{'Lines/s':>12}{'Tokens/s':>12}"
+    )
+
+    results = {}
+    for size in sizes:
+        source_code = generate_program(size, seed=seed)
+        num_lines = source_code.count("\n")
+
+        samples, num_tokens = benchmark_source(source_code, repeat, warmup, time_budget)
+
+        for stage in STAGES:
+            summary = summarize(samples[stage], num_lines, num_tokens)
+            results[(stage, size)] = summary
+
+            print(
+                f"{stage:<16}{num_lines:>8}{num_tokens:>9}{summary['runs']:>6}"
+                f"{summary['median']:>12.4f}{summary['p95']:>10.4f}"
+                f"{summary['lines_per_sec']:>12.0f}{summary['tokens_per_sec']:>12.0f}"
+            )
+
+    return results
@@ -0,0 +1,82 @@
+import math
+import statistics
+
+from simc_test.generator import generate_program
+from simc_test.benchmarks.main import run_pipeline_timed
+
+# Largest accepted growth exponent of every stage. Both stages are somewhat superlinear
+# already, at the default sizes lexical_analyze measures 1.16-1.25 and parse 1.36-1.40.
+# The limits leave a margin of 0.15 for noisy machines, a quadratic stage still fails
+MAX_EXPONENTS = {"lexical_analyze": 1.4, "parse": 1.55}
+
+
+def fit_exponent(sizes, timings):
+    # Slope of the least squares line through log(time) against log(size), time grows
+    # like size ** slope so anything noticeably above 1 is superlinear
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(timing, 1e-9)) for timing in timings]
+    x_mean = statistics.mean(xs)
+    y_mean = statistics.mean(ys)
+
+    numerator = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys))
+    denominator = sum((x - x_mean) ** 2 for x in xs)
+
+    return numerator / denominator
+
+
+def check_scaling(
+    sizes=(500, 1000, 2000, 4000), seed=0, repeat=10, warmup=2, max_exponent=None
+):
+    # Time the stages on generated programs of growing size and fail when the growth
+    # exponent of a stage is above its limit in MAX_EXPONENTS, or above max_exponent for
+    # every stage when it is given. Every round runs each size once and fits an exponent
+    # of its own, a slow moment of the machine then slows the sizes of one round alike
+    # instead of a single size. The median exponent of the rounds counts
+    if max_exponent is None:
+        limits = MAX_EXPONENTS
+    else:
+        limits = {stage: max_exponent for stage in MAX_EXPONENTS}
+
+    sources = [generate_program(size, seed=seed) for size in sizes]
+    num_lines = [source_code.count("\n") for source_code in sources]
+
+    for _ in range(warmup):
+        for source_code in sources:
+            run_pipeline_timed(source_code)
+
+    samples = {stage: [[] for _ in sources] for stage in limits}
+    exponents = {stage: [] for stage in limits}
+    for _ in range(repeat):
+        round_timings = [run_pipeline_timed(source_code)[0] for source_code in sources]
+        for stage in limits:
+            timings = [run_timings[stage] for run_timings in round_timings]
+            exponents[stage].append(fit_exponent(num_lines, timings))
+            for size_samples, timing in zip(samples[stage], timings):
+                size_samples.append(timing)
+
+    print(
+        f"{'Stage':<16}"
+        + "".join(f"{lines:>10}" for lines in num_lines)
+        + f"{'Exponent':>10}{'Limit':>8}"
+    )
+
+    passed = True
+    for stage, limit in limits.items():
+        exponent = statistics.median(exponents[stage])
+        timings = "".join(
+            f"{statistics.median(size_samples):>10.4f}" for size_samples in samples[stage]
+        )
+
+        line = f"{stage:<16}{timings}{exponent:>10.2f}{limit:>8.2f}"
+        if exponent > limit:
+            passed = False
+            print(f"\033[91m{line}\033[m")
+        else:
+            print(f"\033[92m{line}\033[m")
+
+    if passed:
+        print("\033[92mAll stages scale within their limits!\033[m")
+    else:
+        print("\033[91mSome stages grow faster than their limit allows!\033[m")
+
+    return passed
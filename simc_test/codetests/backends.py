@@ -0,0 +1,285 @@
+import contextlib
+import faulthandler
+import gc
+import io
+import json
+import os
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+
+from simc_test.codetests.execution import read_generated_files, write_generated_files
+from simc_test.helpers import make_scratch_dir, remove_dir
+from simc_test.pipeline import compile_simc_source, get_c_filename
+from simc_test.profiling import profile_stages
+
+# Seconds a compile may overrun its timeout to report where it was spinning before it is
+# killed outright
+KILL_GRACE = 5
+
+# ru_maxrss is in kilobytes, except on macOS where it is in bytes
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+class CompileTimeout(BaseException):
+    # Not an Exception so that the except clauses of simc cannot swallow it
+    pass
+
+
+def get_outcome(output):
+    if "C code generated at" in output:
+        return "passed"
+    return "failed"
+
+
+def timeout_result(timeout, stacks=""):
+    output = f"Timed out after {timeout:g}s"
+    if stacks:
+        output += ", simc was running:\n" + stacks.rstrip("\n")
+    return {"outcome": "timeout", "output": output}
+
+
+@contextlib.contextmanager
+def scratch_copy(file):
+    # Every file is compiled in a scratch directory of its own as simc writes the C file
+    # and module headers next to it
+    scratch_dir = make_scratch_dir()
+    try:
+        shutil.copy(file, scratch_dir)
+        yield scratch_dir, os.path.basename(file)
+    finally:
+        remove_dir(scratch_dir)
+
+
+def read_until(fd, deadline, chunks):
+    # Append everything written to fd to chunks until it is closed, returns False when the
+    # deadline passes first
+    while True:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            return False
+
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            continue
+
+        chunk = os.read(fd, 64 * 1024)
+        if not chunk:
+            return True
+        chunks.append(chunk)
+
+
+def communicate(process, timeout):
+    # Output of process, whether it timed out and its peak RSS in bytes. On a timeout it
+    # gets SIGABRT and is killed if it is still running after the grace period. With wait4
+    # the output is read before the process is reaped so that its resource usage can be
+    # asked for, elsewhere there is neither SIGABRT nor a peak RSS. Linux keeps the peak RSS
+    # of the process which started the child across exec, so that is the lowest peak RSS
+    # reported and only compiles above it stand out
+    if not hasattr(os, "wait4"):
+        try:
+            output, _ = process.communicate(timeout=timeout)
+            return output, False, None
+        except subprocess.TimeoutExpired:
+            process.kill()
+            output, _ = process.communicate()
+            return output, True, None
+
+    chunks = []
+    fd = process.stdout.fileno()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    timed_out = not read_until(fd, deadline, chunks)
+    if timed_out:
+        process.send_signal(signal.SIGABRT)
+        if not read_until(fd, time.monotonic() + KILL_GRACE, chunks):
+            process.kill()
+            read_until(fd, None, chunks)
+    process.stdout.close()
+
+    _, status, rusage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    output = b"".join(chunks).decode(errors="replace")
+
+    return output, timed_out, rusage.ru_maxrss * RSS_UNIT
+
+
+def compile_subprocess(file, timeout=None, trace_memory=False, output_dir=None):
+    # With PYTHONFAULTHANDLER set the interpreter of simc prints the stack it was stuck in
+    # when it gets SIGABRT on a timeout. The peak RSS is measured for every file
+    env = dict(os.environ, PYTHONFAULTHANDLER="1")
+    with scratch_copy(file) as (scratch_dir, filename):
+        process = subprocess.Popen(
+            ["simc", filename],
+            cwd=scratch_dir,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+        output, timed_out, peak_memory = communicate(process, timeout)
+
+        if output_dir is not None and not timed_out:
+            write_generated_files(read_generated_files(scratch_dir), output_dir, filename)
+
+    if timed_out:
+        result = timeout_result(timeout, output)
+    else:
+        output = output.rstrip("\n")
+        result = {"outcome": get_outcome(output), "output": output}
+    if peak_memory is not None:
+        result["peak_memory"] = peak_memory
+
+    return file, result
+
+
+@contextlib.contextmanager
+def time_limit(timeout, stack_file):
+    # SIGALRM interrupts the compile after timeout seconds. The handler runs in the main
+    # thread on top of the spinning simc function, faulthandler writes that stack to
+    # stack_file before the compile is unwound. Windows has no SIGALRM
+    if timeout is None or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    def handle_alarm(signum, frame):
+        faulthandler.dump_traceback(file=stack_file, all_threads=False)
+        raise CompileTimeout()
+
+    previous_handler = signal.signal(signal.SIGALRM, handle_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def compile_captured(file, timeout=None, stage=None, output_dir=None):
+    with open(file) as source_file:
+        source_code = source_file.read()
+    c_filename = get_c_filename(os.path.basename(file))
+
+    # The last stage entered is the one a failure or timeout happened in
+    stages = []
+
+    def tracked_stage(name):
+        stages.append(name)
+        return stage(name) if stage is not None else contextlib.nullcontext()
+
+    # simc.global_helpers.error prints the message and calls sys.exit, the message is
+    # captured from stdout and the exit becomes a failure of this file only. The generated
+    # code stays in memory so no scratch directory is needed
+    captured = io.StringIO()
+    with tempfile.TemporaryFile("w+") as stack_file:
+        with contextlib.redirect_stdout(captured):
+            try:
+                with time_limit(timeout, stack_file):
+                    files = compile_simc_source(source_code, c_filename, tracked_stage)
+                if output_dir is not None:
+                    write_generated_files(files, output_dir, os.path.basename(file))
+                print("\033[92mC code generated at %s!" % c_filename, end="")
+                print(" \033[m")
+            except SystemExit:
+                pass
+            except CompileTimeout:
+                stack_file.seek(0)
+                result = timeout_result(timeout, stack_file.read())
+                result["stage"] = stages[-1] if stages else None
+                return result
+            except Exception:
+                traceback.print_exc(file=captured)
+
+    output = captured.getvalue().rstrip("\n")
+    outcome = get_outcome(output)
+    stage_name = stages[-1] if stages and outcome != "passed" else None
+    return {"outcome": outcome, "output": output, "stage": stage_name}
+
+
+def compile_inprocess(
+    file, timeout=None, trace_memory=False, profile_dir=None, output_dir=None
+):
+    # There is no RSS of a single compile in a shared process, with trace_memory the peak
+    # of the Python heap is measured instead. tracemalloc makes compiles about 15 times
+    # slower so it is off by default
+    with profile_stages(file, profile_dir) as stage:
+        if not trace_memory:
+            return file, compile_captured(file, timeout, stage, output_dir)
+
+        tracemalloc.start()
+        try:
+            result = compile_captured(file, timeout, stage, output_dir)
+            result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return file, result
+
+
+def compile_forked(
+    file, timeout=None, trace_memory=False, profile_dir=None, output_dir=None
+):
+    # simc is imported by this process already, a copy-on-write child per file compiles it
+    # without paying for interpreter startup or imports while state simc leaves behind, a
+    # sys.exit or a crash stays in the child. Frozen objects are left alone by the garbage
+    # collector of the child, which keeps their memory pages shared. This process unfreezes
+    # them again so that its own garbage is still collected between compiles
+    read_fd, write_fd = os.pipe()
+    gc.freeze()
+    pid = os.fork()
+    if pid != 0:
+        gc.unfreeze()
+
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            with profile_stages(file, profile_dir) as stage:
+                result = compile_captured(file, timeout, stage, output_dir)
+            with os.fdopen(write_fd, "wb") as pipe:
+                pipe.write(json.dumps(result).encode())
+        finally:
+            os._exit(0)
+
+    # The alarm of the child cannot interrupt simc stuck outside of Python code, so the
+    # child is killed once it overran the timeout by the grace period. The output is read
+    # before waiting so that a large one cannot fill the pipe. The peak RSS of the child
+    # counts the pages it shares with this process as well
+    os.close(write_fd)
+    chunks = []
+    deadline = None if timeout is None else time.monotonic() + timeout + KILL_GRACE
+    finished = read_until(read_fd, deadline, chunks)
+    os.close(read_fd)
+    if not finished:
+        os.kill(pid, signal.SIGKILL)
+    _, status, rusage = os.wait4(pid, 0)
+
+    if not finished:
+        result = timeout_result(timeout)
+    elif os.WIFSIGNALED(status):
+        output = f"Compiler process was killed by signal {os.WTERMSIG(status)}"
+        result = {"outcome": "failed", "output": output}
+    elif not chunks:
+        result = {"outcome": "failed", "output": "Compiler process exited without output"}
+    else:
+        result = json.loads(b"".join(chunks))
+    result["peak_memory"] = rusage.ru_maxrss * RSS_UNIT
+
+    return file, result
+
+
+BACKENDS = {
+    "inprocess": compile_inprocess,
+    "subprocess": compile_subprocess,
+}
+
+# Forking is not available on Windows
+if hasattr(os, "fork"):
+    BACKENDS["forkserver"] = compile_forked
@@ -0,0 +1,185 @@
+import os
+import re
+
+# Strings, character constants, comments, identifiers and single characters of C code
+C_TOKEN = re.compile(
+    r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*.*?\*/|[A-Za-z_]\w*|\S',
+    re.DOTALL,
+)
+
+C_KEYWORDS = {
+    "auto", "break", "case", "char", "const", "continue", "default", "do", "double",
+    "else", "enum", "extern", "float", "for", "goto", "if", "inline", "int", "long",
+    "register", "restrict", "return", "short", "signed", "sizeof", "static", "struct",
+    "switch", "typedef", "union", "unsigned", "void", "volatile", "while", "bool",
+}
+
+SYSTEM_INCLUDE = re.compile(r"\s*#\s*include\s*<[^>]+>")
+LOCAL_INCLUDE = re.compile(r'(\s*#\s*include\s*)"([^"]+)"')
+
+# Prefix of the names of a program in a batch, its main becomes <prefix>main
+PREFIX = "simc_program_{}_"
+PREFIXED_NAME = re.compile(r"simc_program_(\d+)_")
+
+# Start of the lines naming the file a header was included from
+INCLUDED_FROM = "In file included from "
+
+# Compiler and linker lines which make a build fail, other lines are notes and warnings
+ERROR_LINE = re.compile(r"\berror\b|undefined reference|multiple definition", re.IGNORECASE)
+
+
+def find_file_scope_names(code):
+    # Names declared at file scope, which collide when programs share a translation unit:
+    # the name before "(" for functions, before "{" for struct and enum tags and the last
+    # one before "=", ";", "[" or "," for variables and typedefs. Initializers are skipped
+    # as the names they use are declared elsewhere, maybe by a system header
+    names = set()
+    brace_depth = 0
+    paren_depth = 0
+    last_name = None
+    in_initializer = False
+
+    code = "\n".join("" if line.lstrip().startswith("#") else line for line in code.split("\n"))
+    for token in C_TOKEN.findall(code):
+        if token.startswith(("//", "/*", '"', "'")):
+            continue
+
+        at_file_scope = brace_depth == 0 and paren_depth == 0
+        if token == "{":
+            if at_file_scope and last_name and not in_initializer:
+                names.add(last_name)
+            brace_depth += 1
+            last_name = None
+        elif token == "}":
+            brace_depth -= 1
+        elif token == "(":
+            if at_file_scope and last_name and not in_initializer:
+                names.add(last_name)
+            paren_depth += 1
+            last_name = None
+        elif token == ")":
+            paren_depth -= 1
+        elif not at_file_scope:
+            continue
+        elif token in ("=", ";", "[", ","):
+            if last_name and not in_initializer:
+                names.add(last_name)
+            in_initializer = token == "="
+            last_name = None
+        elif token.isidentifier() and token not in C_KEYWORDS:
+            last_name = token
+
+    return names
+
+
+def split_includes(code, build_dir):
+    # System includes of the code, which are hoisted to the top of the batch, and the code
+    # with them blanked out so that line numbers stay the same. Local headers are included
+    # by their path as the batch is compiled from another directory
+    system_includes = []
+    lines = []
+    for line in code.split("\n"):
+        if SYSTEM_INCLUDE.match(line):
+            system_includes.append(line.strip())
+            lines.append("")
+            continue
+
+        match = LOCAL_INCLUDE.match(line)
+        if match:
+            header_path = os.path.join(build_dir, match.group(2))
+            line = f'{match.group(1)}"{header_path}"'
+        lines.append(line)
+
+    return system_includes, "\n".join(lines)
+
+
+def merge_programs(programs, batch_filename):
+    # One translation unit of several programs given as (C filename, build directory)
+    # pairs. The file scope names of every program and its local headers are prefixed
+    # with #define and #undef, so main of program i becomes simc_program_i_main which the
+    # dispatcher main calls by the index in its first argument. #line directives keep the
+    # diagnostics of every program pointing at its own file, by its path so that the
+    # compiler can quote its lines
+    includes = []
+    parts = []
+    for index, (c_filename, build_dir) in enumerate(programs):
+        with open(os.path.join(build_dir, c_filename)) as c_file:
+            code = c_file.read()
+
+        names = find_file_scope_names(code) | {"main"}
+        for header_filename in os.listdir(build_dir):
+            if header_filename.endswith(".h"):
+                with open(os.path.join(build_dir, header_filename)) as header_file:
+                    header_code = header_file.read()
+                names |= find_file_scope_names(header_code)
+                header_includes, _ = split_includes(header_code, build_dir)
+                includes += header_includes
+
+        system_includes, code = split_includes(code, build_dir)
+        includes += system_includes
+
+        prefix = PREFIX.format(index)
+        parts += [f"#define {name} {prefix}{name}" for name in sorted(names)]
+        parts.append(f'#line 1 "{os.path.join(build_dir, c_filename)}"')
+        parts.append(code)
+        parts += [f"#undef {name}" for name in sorted(names)]
+
+    header = list(dict.fromkeys(includes))
+    dispatcher = [
+        "int main(int argc, char **argv) {",
+        "\tint index = 0;",
+        "\tfor (const char *digit = argv[1]; *digit; digit++) {",
+        "\t\tindex = index * 10 + (*digit - '0');",
+        "\t}",
+        "\tswitch (index) {",
+        *[
+            f"\tcase {index}: return {PREFIX.format(index)}main();"
+            for index in range(len(programs))
+        ],
+        "\t}",
+        "\treturn 127;",
+        "}",
+    ]
+
+    source = "\n".join(header + parts)
+    line = source.count("\n") + 3
+    return source + f'\n#line {line} "{batch_filename}"\n' + "\n".join(dispatcher) + "\n"
+
+
+def attribute_diagnostics(output, programs):
+    # Lines of the compiler and linker output per index of a program with errors, by the
+    # file they point at or the prefixed names they mention. The prefixes and build
+    # directories are taken out, so that the lines read like those of a single build
+    files = {}
+    for index, (c_filename, build_dir) in enumerate(programs):
+        files[os.path.join(build_dir, c_filename)] = index
+        for filename in os.listdir(build_dir):
+            if filename.endswith(".h"):
+                files[os.path.join(build_dir, filename)] = index
+
+    diagnostics = {}
+    index = None
+    for line in output.split("\n"):
+        filename = line.split(":")[0]
+        if filename.startswith(INCLUDED_FROM):
+            filename = filename[len(INCLUDED_FROM) :]
+        if line.startswith(" ") or ":(." in line:
+            # Quoted source lines and carets belong to the diagnostic above them, linker
+            # errors at an offset of the code to the function the linker named above them
+            pass
+        elif filename in files:
+            index = files[filename]
+        else:
+            match = PREFIXED_NAME.search(line)
+            index = int(match.group(1)) if match else None
+
+        if index is not None:
+            build_dir = programs[index][1]
+            line = line.replace(PREFIX.format(index), "").replace(build_dir + os.sep, "")
+            diagnostics.setdefault(index, []).append(line)
+
+    return {
+        index: lines
+        for index, lines in diagnostics.items()
+        if any(ERROR_LINE.search(line) for line in lines)
+    }
@@ -0,0 +1,152 @@
+import functools
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+
+from simc_test.helpers import get_cache_dir
+
+
+def sha256_file(file_path):
+    with open(file_path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def get_simc_dir():
+    spec = importlib.util.find_spec("simc")
+    return list(spec.submodule_search_locations)[0]
+
+
+def get_simc_version():
+    # Installed version of simc plus a hash of its sources, a development checkout
+    # installed in editable mode keeps its version number while the compiler changes
+    simc_dir = get_simc_dir()
+
+    version = "unknown"
+    with open(os.path.join(simc_dir, "__init__.py")) as file:
+        for line in file:
+            if line.startswith("__version__"):
+                version = line.split("=")[1].strip().strip("\"'")
+
+    sources_hash = hashlib.sha256()
+    for file_path in sorted(glob.glob(os.path.join(simc_dir, "**", "*.py"), recursive=True)):
+        sources_hash.update(os.path.relpath(file_path, simc_dir).encode())
+        sources_hash.update(sha256_file(file_path).encode())
+
+    return f"{version}+{sources_hash.hexdigest()[:16]}"
+
+
+class ResultCache:
+    """
+    On disk cache of code test results keyed by source hash, simc version and options
+    """
+
+    def __init__(self, options):
+        self.cache_dir = get_cache_dir("results")
+        self.simc_version = get_simc_version()
+        self.options = options
+
+    def key(self, file_path):
+        key_data = json.dumps(
+            [sha256_file(file_path), self.simc_version, self.options], sort_keys=True
+        )
+        return hashlib.sha256(key_data.encode()).hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def load(self, key):
+        try:
+            with open(self.__path(key)) as file:
+                return json.load(file)["result"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def load_generated(self, key):
+        # Generated files are only stored by runs which build the generated programs
+        try:
+            with open(self.__path(key)) as file:
+                return json.load(file)["generated"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store(self, key, result, generated=None):
+        stored = {"result": result}
+        if generated is not None:
+            stored["generated"] = generated
+        write_json(self.__path(key), stored)
+
+
+def write_json(path, data):
+    # Written to a temporary file first so that concurrent runs never read half a result
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+@functools.lru_cache(maxsize=None)
+def get_cc_version(cc_path):
+    try:
+        process = subprocess.run(
+            [cc_path, "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+    except OSError:
+        return "unknown"
+
+    return process.stdout.strip()
+
+
+class ProgramCache:
+    """
+    On disk cache of the programs built from generated C code and the results of running
+    them, keyed by the hash of the C code and headers and the C compiler, its version and
+    flags. A key holds the binary or the result of a failed build, and the run results
+    """
+
+    def __init__(self, cc, cflags):
+        self.cache_dir = get_cache_dir("programs")
+        cc_path = shutil.which(cc) or cc
+        self.compiler = [os.path.realpath(cc_path), get_cc_version(cc_path), cflags]
+
+    def key(self, build_dir):
+        sources = [
+            (filename, sha256_file(os.path.join(build_dir, filename)))
+            for filename in sorted(os.listdir(build_dir))
+            if filename.endswith((".c", ".h"))
+        ]
+        key_data = json.dumps([sources, self.compiler])
+        return hashlib.sha256(key_data.encode()).hexdigest()
+
+    def __dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def load_binary(self, key):
+        binary = os.path.join(self.__dir(key), "program")
+        return binary if os.path.exists(binary) else None
+
+    def store_binary(self, key, binary):
+        # Returns the path of the cached binary, which can be run in place
+        cached_binary = os.path.join(self.__dir(key), "program")
+        os.makedirs(self.__dir(key), exist_ok=True)
+        temp_path = f"{cached_binary}.{os.getpid()}.tmp"
+        shutil.copy2(binary, temp_path)
+        os.replace(temp_path, cached_binary)
+        return cached_binary
+
+    def load(self, key, name):
+        try:
+            with open(os.path.join(self.__dir(key), name + ".json")) as file:
+                return json.load(file)["result"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store(self, key, name, result):
+        write_json(os.path.join(self.__dir(key), name + ".json"), {"result": result})
@@ -0,0 +1,81 @@
+import glob
+import os
+import shutil
+import subprocess
+import tempfile
+
+from simc_test.helpers import get_cache_dir, remove_dir
+
+SIMC_REPO_URL = "https://github.com/cimplec/sim-c"
+SIMC_CODES_DIR = "simc-codes"
+
+
+class CorpusError(Exception):
+    pass
+
+
+def git(*args):
+    process = subprocess.run(
+        ["git", *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    if process.returncode != 0:
+        raise CorpusError(process.stdout.strip())
+
+    return process.stdout.strip()
+
+
+def get_simc_codes(refresh=False):
+    # The clone is kept in the cache directory and only updated when asked to, so runs
+    # work without network access once it exists
+    repo_path = os.path.join(get_cache_dir(), "sim-c")
+
+    if not os.path.isdir(os.path.join(repo_path, ".git")):
+        shutil.rmtree(repo_path, ignore_errors=True)
+        git("clone", "--depth", "1", SIMC_REPO_URL, repo_path)
+    elif refresh:
+        git("-C", repo_path, "fetch", "--depth", "1", "origin")
+        git("-C", repo_path, "reset", "--hard", "FETCH_HEAD")
+
+    return repo_path
+
+
+def snapshot_simc_codes(repo_path):
+    # Corpus snapshots are addressed by the git tree id of simc-codes, so an unchanged
+    # corpus is never copied twice and older revisions stay usable
+    tree_id = git("-C", repo_path, "rev-parse", f"HEAD:{SIMC_CODES_DIR}")
+    corpus_cache_dir = get_cache_dir("corpus")
+    snapshot_path = os.path.join(corpus_cache_dir, tree_id)
+
+    if not os.path.isdir(snapshot_path):
+        # Every run stages its copy in a directory of its own, of concurrent runs the
+        # first rename wins and the others find the same snapshot in place
+        partial_path = tempfile.mkdtemp(prefix=f"{tree_id}.", dir=corpus_cache_dir)
+        # The expected output of a program sits next to its .simc file
+        for pattern in ("*.simc", "*.expected"):
+            for file in glob.glob(os.path.join(repo_path, SIMC_CODES_DIR, pattern)):
+                shutil.copy(file, partial_path)
+        try:
+            os.rename(partial_path, snapshot_path)
+        except OSError:
+            remove_dir(partial_path)
+            if not os.path.isdir(snapshot_path):
+                raise
+
+    return snapshot_path
+
+
+def get_corpus(corpus=None, refresh=False):
+    # Directory containing the .simc files to be tested
+    if corpus is not None:
+        if not os.path.isdir(corpus):
+            raise CorpusError(f"Corpus directory {corpus} does not exist")
+        return corpus
+
+    return snapshot_simc_codes(get_simc_codes(refresh))
+
+
+def list_corpus(corpus_dir):
+    return sorted(glob.glob(os.path.join(corpus_dir, "*.simc")))
@@ -0,0 +1,374 @@
+import difflib
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+
+from simc_test.codetests.batching import attribute_diagnostics, merge_programs
+from simc_test.codetests.cache import ProgramCache, sha256_file
+from simc_test.helpers import TimedCall, run_in_pool
+from simc_test.pipeline import get_c_filename
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource limits, generated programs only get the timeout there
+    resource = None
+
+# Seconds a generated program may run, it gets as many seconds of CPU time
+RUN_TIMEOUT = 10
+
+# Address space and output of a generated program, writing more output kills it
+MEMORY_LIMIT = 512 * 1024 * 1024
+OUTPUT_LIMIT = 16 * 1024 * 1024
+
+# Lines of compiler errors and output differences shown for a failed program
+MAX_REPORT_LINES = 20
+
+
+def get_cc():
+    # CC and CFLAGS pick the C compiler and its flags like they do for make
+    return os.environ.get("CC", "cc"), shlex.split(os.environ.get("CFLAGS", "-O0 -w"))
+
+
+def find_cc():
+    cc, _ = get_cc()
+    return shutil.which(cc)
+
+
+def get_expected_file(file):
+    # hello.simc -> hello.expected
+    return os.path.splitext(file)[0] + ".expected"
+
+
+def write_generated_files(files, output_dir, filename):
+    # The generated C file and module headers of a .simc file go to a directory named
+    # after it, where they can be built
+    build_dir = os.path.join(output_dir, filename)
+    os.makedirs(build_dir, exist_ok=True)
+    for generated_filename, code in files.items():
+        with open(os.path.join(build_dir, generated_filename), "w") as generated_file:
+            generated_file.write(code)
+
+
+def read_generated_files(build_dir):
+    files = {}
+    for generated_filename in os.listdir(build_dir):
+        if generated_filename.endswith((".c", ".h")):
+            with open(os.path.join(build_dir, generated_filename)) as generated_file:
+                files[generated_filename] = generated_file.read()
+
+    return files
+
+
+def get_run_key(file):
+    # Name of the cached result of running a program, which depends on the expected output
+    # and the limits it ran with as well
+    expected_file = get_expected_file(file)
+    expected_hash = sha256_file(expected_file) if os.path.exists(expected_file) else None
+    run_data = json.dumps([expected_hash, RUN_TIMEOUT, MEMORY_LIMIT, OUTPUT_LIMIT])
+    return "run-" + hashlib.sha256(run_data.encode()).hexdigest()
+
+
+def limit_resources():
+    # Runs in the child between fork and exec of a generated program
+    resource.setrlimit(resource.RLIMIT_CPU, (RUN_TIMEOUT, RUN_TIMEOUT))
+    resource.setrlimit(resource.RLIMIT_AS, (MEMORY_LIMIT, MEMORY_LIMIT))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (OUTPUT_LIMIT, OUTPUT_LIMIT))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def tail(text, max_lines=MAX_REPORT_LINES):
+    lines = text.rstrip("\n").split("\n")
+    if len(lines) > max_lines:
+        lines = [f"... {len(lines) - max_lines} more lines"] + lines[-max_lines:]
+    return "\n".join(lines)
+
+
+def build_program(build_dir, c_filename):
+    # Returns the path of the binary and the output of the compiler, the binary is None
+    # when the C code did not compile. Module headers are next to the C file, OSError is
+    # raised when the compiler cannot be started
+    cc, cflags = get_cc()
+    binary = os.path.join(build_dir, "program")
+    process = subprocess.run(
+        [cc, *cflags, "-o", binary, c_filename],
+        cwd=build_dir,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    if process.returncode != 0:
+        return None, process.stdout
+
+    return binary, process.stdout
+
+
+def build_failure(cc_output):
+    output = "The generated C code does not compile:\n" + tail(cc_output)
+    return {"outcome": "failed", "output": output, "stage": "build"}
+
+
+def start_error(stage, error):
+    # The compiler or the program could not be started, which says nothing about the code
+    # and is neither cached nor counted as a failure of it
+    subject = "C compiler" if stage == "build" else "generated program"
+    output = f"The {subject} could not be started: {error}"
+    return {"outcome": "error", "output": output, "stage": stage}
+
+
+def is_cacheable(result):
+    # Timeouts and errors of starting a process may not happen again
+    return result["outcome"] not in ("timeout", "error")
+
+
+def describe_exit(returncode):
+    if returncode < 0:
+        try:
+            return f"was killed by {signal.Signals(-returncode).name}"
+        except ValueError:
+            return f"was killed by signal {-returncode}"
+    return f"exited with status {returncode}"
+
+
+def run_program(binary, build_dir, args=()):
+    # Returns the exit status and output of the program, None as the status when it ran
+    # out of wall clock or CPU time. Output goes to files so that the size limit applies
+    # to it and a chatty program cannot fill the memory of the test suite
+    stdout_path = os.path.join(build_dir, "stdout")
+    stderr_path = os.path.join(build_dir, "stderr")
+    with open(stdout_path, "wb") as stdout_file, open(stderr_path, "wb") as stderr_file:
+        process = subprocess.Popen(
+            [binary, *args],
+            cwd=build_dir,
+            stdin=subprocess.DEVNULL,
+            stdout=stdout_file,
+            stderr=stderr_file,
+            preexec_fn=limit_resources if resource is not None else None,
+        )
+        try:
+            returncode = process.wait(timeout=RUN_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            returncode = None
+
+    if resource is not None and returncode == -signal.SIGXCPU:
+        returncode = None
+
+    with open(stdout_path, "rb") as stdout_file:
+        stdout = stdout_file.read()
+    with open(stderr_path, "rb") as stderr_file:
+        stderr = stderr_file.read().decode(errors="replace")
+
+    return returncode, stdout, stderr
+
+
+def end_with_newline(output):
+    return output if output.endswith(b"\n") else output + b"\n"
+
+
+def compare_output(expected, actual):
+    # Difference between the expected and actual output, None when they match. A missing
+    # final newline does not count, editors end .expected files with one while print of
+    # simc writes none. Lines keep their endings so that every other difference shows up
+    expected = end_with_newline(expected)
+    actual = end_with_newline(actual)
+    if expected == actual:
+        return None
+
+    diff = difflib.unified_diff(
+        expected.decode(errors="replace").splitlines(keepends=True),
+        actual.decode(errors="replace").splitlines(keepends=True),
+        "expected",
+        "actual",
+        lineterm="",
+    )
+    return tail("\n".join(line.rstrip("\n").replace("\r", "\\r") for line in diff))
+
+
+def run_and_compare(file, binary, build_dir, args=()):
+    # Result of running the program of a .simc file, its output is compared with the
+    # .expected file next to the .simc file when there is one
+    try:
+        returncode, stdout, stderr = run_program(binary, build_dir, args)
+    except OSError as e:
+        return start_error("run", e)
+    if returncode is None:
+        output = f"The generated program timed out after {RUN_TIMEOUT}s"
+        return {"outcome": "timeout", "output": output, "stage": "run"}
+    if returncode != 0:
+        output = f"The generated program {describe_exit(returncode)}"
+        if stderr:
+            output += ":\n" + tail(stderr)
+        return {"outcome": "failed", "output": output, "stage": "run"}
+
+    expected_file = get_expected_file(file)
+    if os.path.exists(expected_file):
+        with open(expected_file, "rb") as expected:
+            diff = compare_output(expected.read(), stdout)
+        if diff is not None:
+            output = "The output of the generated program is wrong:\n" + diff
+            return {"outcome": "failed", "output": output, "stage": "run"}
+
+    return {"outcome": "passed"}
+
+
+def build_and_run(program):
+    # Builds the C code generated for a .simc file and runs it. Returns a result like the
+    # compile backends do, with build or run as the stage of a failure, and whether the
+    # result was replayed from the cache. With the cache, unchanged C code built by the
+    # same compiler is neither built nor run again, timeouts and start errors are not
+    # cached
+    file, output_dir, cached = program
+    filename = os.path.basename(file)
+    build_dir = os.path.join(output_dir, filename)
+
+    cache = ProgramCache(*get_cc()) if cached else None
+    binary = None
+    if cache is not None:
+        key = cache.key(build_dir)
+        build_result = cache.load(key, "build")
+        if build_result is not None:
+            return file, build_result, True
+        binary = cache.load_binary(key)
+
+    if binary is None:
+        try:
+            binary, cc_output = build_program(build_dir, get_c_filename(filename))
+        except OSError as e:
+            return file, start_error("build", e), False
+        if binary is None:
+            build_result = build_failure(cc_output)
+            if cache is not None:
+                cache.store(key, "build", build_result)
+            return file, build_result, False
+        if cache is not None:
+            binary = cache.store_binary(key, binary)
+
+    if cache is not None:
+        run_key = get_run_key(file)
+        run_result = cache.load(key, run_key)
+        if run_result is not None:
+            return file, run_result, True
+
+    run_result = run_and_compare(file, binary, build_dir)
+    if cache is not None and is_cacheable(run_result):
+        cache.store(key, run_key, run_result)
+
+    return file, run_result, False
+
+
+def build_batch(batch):
+    # Builds the programs of a batch as one translation unit, so that the C compiler
+    # starts once for all of them. Programs whose code has errors are left out and the
+    # rest is built again, when the errors cannot be put down to a program they are all
+    # built on their own. Returns the results of the programs which failed to build or
+    # were replayed from the cache and the programs to run as (file, binary, build
+    # directory, arguments of the binary, cached)
+    index, files, output_dir, cached = batch
+    cache = ProgramCache(*get_cc()) if cached else None
+    results = []
+    runs = []
+
+    pending = []
+    for file in files:
+        filename = os.path.basename(file)
+        build_dir = os.path.join(output_dir, filename)
+        if cache is not None:
+            key = cache.key(build_dir)
+            result = cache.load(key, "build") or cache.load(key, get_run_key(file))
+            if result is not None:
+                results.append((file, result, True))
+                continue
+            binary = cache.load_binary(key)
+            if binary is not None:
+                runs.append((file, binary, build_dir, (), cached))
+                continue
+        pending.append((file, get_c_filename(filename), build_dir))
+
+    batch_dir = os.path.join(output_dir, f"batch-{index}")
+    os.makedirs(batch_dir, exist_ok=True)
+    while pending:
+        programs = [(c_filename, build_dir) for _, c_filename, build_dir in pending]
+        with open(os.path.join(batch_dir, "batch.c"), "w") as batch_file:
+            batch_file.write(merge_programs(programs, "batch.c"))
+
+        try:
+            binary, cc_output = build_program(batch_dir, "batch.c")
+        except OSError as e:
+            results += [(file, start_error("build", e), False) for file, _, _ in pending]
+            break
+        if binary is not None:
+            for i, (file, _, build_dir) in enumerate(pending):
+                runs.append((file, binary, build_dir, (str(i),), cached))
+            break
+
+        diagnostics = attribute_diagnostics(cc_output, programs)
+        if not diagnostics:
+            for file, c_filename, build_dir in pending:
+                try:
+                    binary, cc_output = build_program(build_dir, c_filename)
+                except OSError as e:
+                    results.append((file, start_error("build", e), False))
+                    continue
+                if binary is not None:
+                    runs.append((file, binary, build_dir, (), cached))
+                    continue
+                result = build_failure(cc_output)
+                results.append((file, result, False))
+                if cache is not None:
+                    cache.store(cache.key(build_dir), "build", result)
+            break
+
+        for i, lines in diagnostics.items():
+            file, _, build_dir = pending[i]
+            result = build_failure("\n".join(lines))
+            results.append((file, result, False))
+            if cache is not None:
+                cache.store(cache.key(build_dir), "build", result)
+        pending = [program for i, program in enumerate(pending) if i not in diagnostics]
+
+    return results, runs
+
+
+def run_built_program(run):
+    # Runs a program built by build_batch, timeouts and start errors are not cached
+    file, binary, build_dir, args, cached = run
+    result = run_and_compare(file, binary, build_dir, args)
+    if cached and is_cacheable(result):
+        cache = ProgramCache(*get_cc())
+        cache.store(cache.key(build_dir), get_run_key(file), result)
+
+    return file, result, False
+
+
+def run_programs(files, output_dir, cached, jobs, batch_size=None):
+    # Yields the result of build_and_run for the program of every file with how long it
+    # took. With a batch size the programs are built batch_size at a time and run once all
+    # batches are built, every program of a batch gets an equal share of its build time
+    if not batch_size:
+        programs = [(file, output_dir, cached) for file in files]
+        yield from run_in_pool(TimedCall(build_and_run), programs, jobs)
+        return
+
+    batches = [
+        (index, files[start : start + batch_size], output_dir, cached)
+        for index, start in enumerate(range(0, len(files), batch_size))
+    ]
+    runs = []
+    build_shares = {}
+    for (results, batch_runs), duration in run_in_pool(TimedCall(build_batch), batches, jobs):
+        built = [result for result in results if not result[2]] + batch_runs
+        share = duration / len(built) if built else 0.0
+        for result in results:
+            yield result, share
+        for run in batch_runs:
+            build_shares[run[0]] = share
+        runs += batch_runs
+
+    for result, duration in run_in_pool(TimedCall(run_built_program), runs, jobs):
+        yield result, duration + build_shares[result[0]]
@@ -1,45 +1,250 @@
-import subprocess
-from tqdm import tqdm
+import functools
 import os
-import glob
 
-from simc_test.helpers import make_dir, remove_dir
+from tqdm import tqdm
+
+from simc_test.helpers import (
+    TimedCall,
+    default_jobs,
+    make_scratch_dir,
+    remove_dir,
+    run_in_pool,
+)
+from simc_test.codetests.backends import BACKENDS
+from simc_test.codetests.execution import (
+    find_cc,
+    get_cc,
+    read_generated_files,
+    run_programs,
+    write_generated_files,
+)
+from simc_test.codetests.corpus import CorpusError, get_corpus, list_corpus
+from simc_test.codetests.cache import ResultCache
+from simc_test.profiling import combine_profiles, print_hot_functions
+from simc_test.sharding import shard_items
+
+# Number of files listed by the peak memory summary
+MEMORY_REPORT_SIZE = 5
 
 
-def get_simc_codes():
-    _ = subprocess.getoutput("git clone https://github.com/cimplec/sim-c")
+def format_size(num_bytes):
+    if num_bytes < 1024 * 1024:
+        return f"{num_bytes / 1024:.1f} KiB"
+    return f"{num_bytes / (1024 * 1024):.1f} MiB"
 
 
-def run_simc_codes():
-    test_dir_path = ".simc-test-suite"
-    make_dir(test_dir_path)
-    os.chdir(test_dir_path)
+def print_memory_summary(results):
+    # The files with the largest peak memory, which is the peak RSS of the compiling process
+    # or the peak of the Python heap for traced in-process compiles. Results without a
+    # measurement are left out
+    measured = [
+        (result["peak_memory"], filename)
+        for filename, result in results
+        if result.get("peak_memory") is not None
+    ]
+    if not measured:
+        return
 
-    get_simc_codes()
-    os.chdir("sim-c/simc-codes")
+    measured.sort(reverse=True)
+    print(f"\033[1;37;0mThe files with the largest peak memory are:-")
+    for peak_memory, filename in measured[:MEMORY_REPORT_SIZE]:
+        print(f"\033[1;37;0m{filename} - {format_size(peak_memory)}")
+    print()
 
-    files = glob.glob("*.simc")
 
+def print_code_summary(results):
+    # Summary of (filename, result) pairs, returns whether all of them passed. Timeouts
+    # are counted on their own as they point at a hang rather than a compile error
     correct = 0
     wrong = {}
+    timed_out = {}
 
-    for i in tqdm(range(len(files))):
-        filename_c = "".join(os.path.basename(files[i]).split(".")[:-1]) + ".c"
-        output = subprocess.getoutput(f"simc {files[i]}")
-        if "C code generated at" in output:
+    for filename, result in results:
+        if result["outcome"] == "passed":
             correct += 1
+        elif result["outcome"] == "timeout":
+            timed_out[filename] = result["output"]
         else:
-            wrong[files[i]] = output
+            wrong[filename] = result["output"]
 
-    print(f"\033[92m[{correct}/{len(files)}] tests passed!")
-    print(f"\033[91m[{len(wrong)}/{len(files)}] tests failed!\n")
+    print(f"\033[92m[{correct}/{len(results)}] tests passed!")
+    if timed_out:
+        print(f"\033[91m[{len(wrong)}/{len(results)}] tests failed!")
+        print(f"\033[93m[{len(timed_out)}/{len(results)}] tests timed out!\n")
+    else:
+        print(f"\033[91m[{len(wrong)}/{len(results)}] tests failed!\n")
+    print_memory_summary(results)
     if len(wrong) > 0:
         print(f"\033[1;37;0mThe list of files that failed to pass test are:-")
         for file, error_msg in wrong.items():
             print(f"\033[1;37;0m{file} - {error_msg}")
+    if len(timed_out) > 0:
+        print(f"\033[1;37;0mThe list of files that timed out are:-")
+        for file, error_msg in timed_out.items():
+            print(f"\033[1;37;0m{file} - {error_msg}")
 
     # Set the terminal to default colors
     print("\033[m", end="")
 
-    os.chdir("../../../")
-    remove_dir(".simc-test-suite")
+    return correct == len(results)
+
+
+def print_profile_summary(profile_dir, filenames):
+    combined = combine_profiles(profile_dir, filenames)
+    if combined is None:
+        return
+
+    print(f"\033[1;37;0mProfiles of every stage of every file are in {profile_dir}, the")
+    print(f"hottest simc functions of all files (combined.pstats, combined.collapsed) are:-")
+    print_hot_functions(combined)
+
+
+def run_simc_codes(
+    jobs=None,
+    backend="inprocess",
+    corpus=None,
+    refresh_corpus=False,
+    cached=False,
+    impact=None,
+    shard=None,
+    history=None,
+    results=None,
+    timeout=None,
+    trace_memory=False,
+    profile_dir=None,
+    execute=False,
+    batch_size=None,
+):
+    if jobs is None:
+        jobs = default_jobs()
+
+    options = {"timeout": timeout, "trace_memory": trace_memory}
+
+    # Profiles are taken of the pipeline in this process or a fork of it, simc run as a
+    # command is out of reach. Every file has to be compiled to be profiled
+    if profile_dir is not None:
+        if backend == "subprocess":
+            print("\033[91m--profile needs the inprocess or forkserver backend!\033[m")
+            return False
+        options["profile_dir"] = os.path.abspath(profile_dir)
+        cached = False
+
+    if batch_size is not None and not execute:
+        print("\033[91m--batch-size builds the programs of --execute!\033[m")
+        return False
+
+    if execute and find_cc() is None:
+        print(f"\033[91mNo C compiler {get_cc()[0]} to build the generated code!\033[m")
+        return False
+
+    try:
+        corpus_dir = get_corpus(corpus, refresh=refresh_corpus)
+    except CorpusError as e:
+        print(f"\033[91mCould not get the sim-C codes: {e}\033[m")
+        return False
+
+    files = list_corpus(corpus_dir)
+
+    # Only compile the files affected by the changes of simc
+    if impact is not None:
+        files = impact.select_corpus_files(files)
+        if not files:
+            print("\033[92mNo code tests are affected by the changes!\033[m")
+            return
+
+    # Only this node's part of the files, balanced with the durations of a --history file
+    if shard is not None:
+        durations = None
+        if history is not None and history.shared:
+            durations = history.get("code")
+        files_by_name = {os.path.basename(file): file for file in files}
+        names = shard_items(list(files_by_name), shard, durations)
+        files = [files_by_name[name] for name in names]
+        if not files:
+            print("\033[92mNo code tests in this shard!\033[m")
+            return
+
+    # The C code is written to a scratch directory to build the programs from
+    output_dir = make_scratch_dir("simc-test-programs-", executable=True) if execute else None
+    compile_simc_file = TimedCall(
+        functools.partial(BACKENDS[backend], output_dir=output_dir, **options)
+    )
+
+    try:
+        # Replay the stored results of files whose source, compiler and options are
+        # unchanged. Programs are built from the stored C code, a file stored without it
+        # is compiled again. Files whose program is run are reported once it ran, files
+        # replayed from the cache without a duration
+        file_results = {}
+        cache_keys = {}
+        compile_durations = {}
+        if cached:
+            cache = ResultCache({"backend": backend, "trace_memory": trace_memory})
+            for file in files:
+                filename = os.path.basename(file)
+                cache_keys[file] = cache.key(file)
+                result = cache.load(cache_keys[file])
+                if result is None:
+                    continue
+
+                if execute and result["outcome"] == "passed":
+                    generated = cache.load_generated(cache_keys[file])
+                    if generated is None:
+                        continue
+                    write_generated_files(generated, output_dir, filename)
+                    compile_durations[file] = None
+                elif results is not None:
+                    results.add_code(filename, result, None)
+                file_results[file] = result
+
+        files_to_compile = [file for file in files if file not in file_results]
+
+        # Recent failures and the longest files start first
+        if history is not None:
+            files_to_compile = history.schedule("code", files_to_compile, os.path.basename)
+
+        # Collect results as the compilations finish, the summary is built in file order
+        # below. A timeout may not happen again, so it is not cached
+        with tqdm(total=len(files), initial=len(file_results)) as progress:
+            timed_results = run_in_pool(compile_simc_file, files_to_compile, jobs)
+            for (file, result), duration in timed_results:
+                filename = os.path.basename(file)
+                file_results[file] = result
+                generated = None
+                if execute and result["outcome"] == "passed":
+                    generated = read_generated_files(os.path.join(output_dir, filename))
+                    compile_durations[file] = duration
+                elif results is not None:
+                    results.add_code(filename, result, duration)
+                if cached and result["outcome"] != "timeout":
+                    cache.store(cache_keys[file], result, generated)
+                progress.update()
+
+        # The programs are built and run in a pool of their own, a failure replaces the
+        # result of simc. The duration of a file covers both, a file whose compile and run
+        # were both replayed has none
+        programs = list(compile_durations)
+        with tqdm(total=len(programs), disable=not programs) as progress:
+            timed_results = run_programs(programs, output_dir, cached, jobs, batch_size)
+            for (file, run_result, replayed), duration in timed_results:
+                if run_result["outcome"] != "passed":
+                    file_results[file] = dict(file_results[file], **run_result)
+                if replayed:
+                    duration = compile_durations[file]
+                elif compile_durations[file] is not None:
+                    duration += compile_durations[file]
+                if results is not None:
+                    results.add_code(os.path.basename(file), file_results[file], duration)
+                progress.update()
+    finally:
+        if output_dir is not None:
+            remove_dir(output_dir)
+
+    passed = print_code_summary(
+        [(os.path.basename(file), file_results[file]) for file in files]
+    )
+
+    if profile_dir is not None:
+        print_profile_summary(profile_dir, [os.path.basename(file) for file in files])
+
+    return passed
@@ -0,0 +1,213 @@
+import random
+
+
+class ProgramGenerator:
+    """
+    Seeded generator of valid sim-C programs of any size, built from the constructs the
+    parser tests cover: functions, structs, arrays, if/else, switch/case and loops. Blocks
+    are nested inside MAIN only and do-while loops neither nest nor contain while loops, as
+    that is what simc accepts
+    """
+
+    def __init__(self, seed=0, max_depth=6):
+        self.random = random.Random(seed)
+        self.max_depth = max_depth
+        self.lines = []
+        self.num_names = 0
+        self.functions = []
+        self.arrays_allowed = False
+        self.in_do_block = False
+
+    def __name(self, prefix):
+        # Every name is unique so declarations never clash across scopes
+        self.num_names += 1
+        return f"{prefix}_{self.num_names}"
+
+    def __emit(self, depth, line):
+        self.lines.append("    " * depth + line)
+
+    def __operand(self, variables):
+        if variables and self.random.random() < 0.7:
+            return self.random.choice(variables)
+        return str(self.random.randint(0, 100))
+
+    def __expression(self, variables):
+        operator = self.random.choice(["+", "-", "*"])
+        return f"{self.__operand(variables)} {operator} {self.__operand(variables)}"
+
+    def __condition(self, variables):
+        operator = self.random.choice(["<", ">", "==", "!=", "<=", ">="])
+        return f"{self.__operand(variables)} {operator} {self.__operand(variables)}"
+
+    def __block(self, depth, variables, num_statements):
+        # Variables declared in a block are only visible inside of it
+        variables = list(variables)
+        for _ in range(num_statements):
+            self.__statement(depth, variables)
+
+    def __call(self, variables):
+        name, num_params = self.random.choice(self.functions)
+        args = ", ".join(self.__operand(variables) for _ in range(num_params))
+        return f"{name}({args})"
+
+    def __statement(self, depth, variables):
+        # simc loses track of function return types once an array was declared, so arrays
+        # only appear in the last part of MAIN after all function calls
+        kinds = ["var", "var", "assign", "print"]
+        if self.arrays_allowed:
+            kinds.append("array")
+        elif self.functions:
+            kinds.append("call")
+        if depth < self.max_depth:
+            kinds += ["if", "for", "switch"]
+            if not self.in_do_block:
+                kinds.append("while")
+        if depth == 1:
+            kinds.append("do")
+
+        kind = self.random.choice(kinds)
+        num_statements = self.random.randint(1, 3)
+
+        if kind == "var":
+            name = self.__name("var")
+            self.__emit(depth, f"var {name} = {self.__expression(variables)}")
+            variables.append(name)
+        elif kind == "assign" and variables:
+            name = self.random.choice(variables)
+            self.__emit(depth, f"{name} = {self.__expression(variables)}")
+        elif kind == "print":
+            self.__emit(depth, f"print({self.__operand(variables)})")
+        elif kind == "call":
+            name = self.__name("result")
+            self.__emit(depth, f"var {name} = {self.__call(variables)}")
+            variables.append(name)
+        elif kind == "array":
+            name = self.__name("arr")
+            size = self.random.randint(1, 8)
+            values = ", ".join(str(self.random.randint(0, 100)) for _ in range(size))
+            self.__emit(depth, f"var {name}[{size}] = {{{values}}}")
+
+            # Array elements are not reused, simc cannot pass them on to functions
+            element = self.__name("elem")
+            self.__emit(depth, f"var {element} = {name}[{self.random.randrange(size)}]")
+        elif kind == "if":
+            self.__emit(depth, f"if({self.__condition(variables)}) {{")
+            self.__block(depth + 1, variables, num_statements)
+            if self.random.random() < 0.5:
+                self.__emit(depth, f"}} else if({self.__condition(variables)}) {{")
+                self.__block(depth + 1, variables, num_statements)
+            if self.random.random() < 0.5:
+                self.__emit(depth, "} else {")
+                self.__block(depth + 1, variables, num_statements)
+            self.__emit(depth, "}")
+        elif kind == "for":
+            iterator = self.__name("i")
+            start = self.random.randint(0, 5)
+            end = start + self.random.randint(1, 10)
+            self.__emit(depth, f"for {iterator} in {start} to {end} by +1 {{")
+            self.__block(depth + 1, variables + [iterator], num_statements)
+            self.__emit(depth, "}")
+        elif kind == "while":
+            counter = self.__name("count")
+            self.__emit(depth, f"var {counter} = 0")
+            self.__emit(depth, f"while({counter} < {self.random.randint(1, 10)}) {{")
+            self.__emit(depth + 1, f"{counter} = {counter} + 1")
+            self.__block(depth + 1, variables + [counter], num_statements)
+            self.__emit(depth, "}")
+            variables.append(counter)
+        elif kind == "do":
+            counter = self.__name("count")
+            self.__emit(depth, f"var {counter} = {self.random.randint(1, 10)}")
+            self.__emit(depth, "do {")
+            self.__emit(depth + 1, f"{counter} = {counter} - 1")
+            self.in_do_block = True
+            self.__block(depth + 1, variables + [counter], num_statements)
+            self.in_do_block = False
+            self.__emit(depth, f"}} while({counter} > 0)")
+            variables.append(counter)
+        elif kind == "switch":
+            self.__emit(depth, f"switch({self.__operand(variables)}) {{")
+            for case in self.random.sample(range(100), self.random.randint(1, 3)):
+                self.__emit(depth + 1, f"case {case}:")
+                self.__block(depth + 2, variables, num_statements)
+                self.__emit(depth + 2, "break")
+            self.__emit(depth + 1, "default:")
+            self.__block(depth + 2, variables, 1)
+            self.__emit(depth, "}")
+
+    def __struct(self):
+        name = self.__name("struct")
+        self.__emit(0, f"struct {name} {{")
+        for _ in range(self.random.randint(1, 4)):
+            self.__emit(1, f"var {self.__name('field')} = {self.random.randint(0, 100)}")
+        self.__emit(0, "}")
+        self.__emit(0, "")
+
+        return name
+
+    def __function(self):
+        name = self.__name("func")
+        params = [self.__name("param") for _ in range(self.random.randint(1, 3))]
+
+        # Function bodies are straight-line code which may call earlier functions, simc
+        # only knows the types of parameters once the function is called so nothing
+        # derived from them is printed or passed on
+        self.__emit(0, f"fun {name}({', '.join(params)}) {{")
+        local_variables = []
+        for _ in range(self.random.randint(1, 4)):
+            kind = self.random.choice(["var", "var", "assign", "print", "call"])
+            if kind == "assign" and local_variables:
+                local = self.random.choice(local_variables)
+                self.__emit(1, f"{local} = {self.__expression(params + local_variables)}")
+            elif kind == "print":
+                self.__emit(1, f"print({self.__operand([])})")
+            elif kind == "call" and self.functions:
+                local = self.__name("local")
+                self.__emit(1, f"var {local} = {self.__call([])}")
+                local_variables.append(local)
+            else:
+                local = self.__name("local")
+                self.__emit(1, f"var {local} = {self.__expression(params + local_variables)}")
+                local_variables.append(local)
+        self.__emit(1, f"return {self.__expression(params + local_variables)}")
+        self.__emit(0, "}")
+        self.__emit(0, "")
+
+        self.functions.append((name, len(params)))
+
+    def generate(self, num_lines):
+        # Roughly a third of the program is spent on functions and structs, the rest is MAIN
+        structs = []
+        while len(self.lines) < num_lines // 3:
+            if self.random.random() < 0.2:
+                structs.append(self.__struct())
+            else:
+                self.__function()
+
+        self.__emit(0, "MAIN")
+        variables = []
+
+        # Every function is called once so that simc can infer its types
+        for name, num_params in self.functions:
+            args = ", ".join(str(self.random.randint(0, 100)) for _ in range(num_params))
+            result = self.__name("result")
+            self.__emit(1, f"var {result} = {name}({args})")
+            variables.append(result)
+
+        for name in structs:
+            self.__emit(1, f"{name} {self.__name('instance')}")
+
+        while len(self.lines) < num_lines * 3 // 4:
+            self.__statement(1, variables)
+
+        self.arrays_allowed = True
+        while len(self.lines) < num_lines - 1:
+            self.__statement(1, variables)
+
+        self.__emit(0, "END_MAIN")
+
+        return "\n".join(self.lines) + "\n"
+
+
+def generate_program(lines, seed=0, max_depth=6):
+    return ProgramGenerator(seed=seed, max_depth=max_depth).generate(lines)
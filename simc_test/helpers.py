@@ -1,5 +1,9 @@
 import os
 import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
 def remove_dir(dir_path):
@@ -10,8 +14,70 @@ def remove_dir(dir_path):
             _ = subprocess.getoutput(f'rd /s /q "{dir_path}"')
 
 
-def make_dir(dir_path):
-    if os.path.exists(dir_path):
-        remove_dir(dir_path)
+def get_scratch_root():
+    # Scratch files are small and short lived so tmpfs is preferred when it is available,
+    # SIMC_TEST_TMPDIR overrides the location
+    scratch_root = os.environ.get("SIMC_TEST_TMPDIR")
+    if scratch_root:
+        return scratch_root
+
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+
+    return tempfile.gettempdir()
+
+
+def make_scratch_dir(prefix="simc-test-", executable=False):
+    # Unique directory so that tests and compilations never share files with each other,
+    # even across concurrent runs of the test suite. Programs have to be able to run from
+    # an executable one, tmpfs like /dev/shm is often mounted noexec
+    scratch_root = tempfile.gettempdir() if executable else get_scratch_root()
+    return tempfile.mkdtemp(prefix=prefix, dir=scratch_root)
+
+
+def get_cache_dir(*parts):
+    # Persistent directory shared by runs of the test suite, SIMC_TEST_CACHE overrides it
+    cache_dir = os.environ.get("SIMC_TEST_CACHE")
+    if not cache_dir:
+        xdg_cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        cache_dir = os.path.join(xdg_cache_dir, "simc-test")
+
+    dir_path = os.path.join(cache_dir, *parts)
+    os.makedirs(dir_path, exist_ok=True)
+
+    return dir_path
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+class TimedCall:
+    """
+    Wraps a function to return how long every call took along with its result, it can be
+    pickled and sent to worker processes as long as the function can
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, item):
+        started = time.perf_counter()
+        result = self.func(item)
+        return result, time.perf_counter() - started
+
+
+def run_in_pool(func, items, jobs):
+    # Yield func(item) for every item in the order the jobs finish, with a single job
+    # everything runs in the current process so no pool is spawned at all
+    if jobs <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
 
-    os.mkdir(dir_path)
+    with ProcessPoolExecutor(max_workers=min(jobs, len(items))) as executor:
+        futures = [executor.submit(func, item) for item in items]
+        for future in as_completed(futures):
+            yield future.result()
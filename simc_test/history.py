@@ -0,0 +1,81 @@
+import json
+import os
+import statistics
+
+from simc_test.helpers import get_cache_dir
+
+# Kinds of test with a history, unit tests are keyed by test id and code tests by filename
+KINDS = ("unit", "code")
+
+
+def get_history_path():
+    return os.path.join(get_cache_dir("history"), "durations.json")
+
+
+class DurationHistory:
+    """
+    How long every unit test and code test took in earlier runs, kept as an exponential
+    moving average so that a single slow run does not dominate, and which of them failed
+    the last time they ran
+    """
+
+    def __init__(self, path=None, weight=0.5):
+        # Only a history given by its path is the same on every node, the one in the
+        # cache directory of a node cannot balance shards
+        self.shared = path is not None
+        self.path = path or get_history_path()
+        self.weight = weight
+        self.durations = {kind: {} for kind in KINDS}
+        self.failed = {kind: set() for kind in KINDS}
+        self.default_durations = {}
+
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                stored = json.load(file)
+            for kind in KINDS:
+                self.durations[kind].update(stored.get("durations", {}).get(kind, {}))
+                self.failed[kind].update(stored.get("failed", {}).get(kind, []))
+
+    def get(self, kind):
+        return self.durations[kind]
+
+    def update(self, kind, durations, failed=()):
+        # Items which ran are failed or not depending on this run only
+        history = self.durations[kind]
+        for name, duration in durations.items():
+            if name in history:
+                duration = self.weight * duration + (1 - self.weight) * history[name]
+            history[name] = duration
+
+        self.failed[kind] -= set(durations)
+        self.failed[kind] |= set(failed)
+        self.default_durations.pop(kind, None)
+
+    def add_results(self, results):
+        for kind in KINDS:
+            self.update(kind, results.durations[kind], results.failed[kind])
+
+    def priority(self, kind, name):
+        # Sort key running recent failures first so they are reported early, then the
+        # longest items so that the run does not end waiting on a slow one. Items without
+        # a history are assumed to take the median time
+        if kind not in self.default_durations:
+            known = list(self.durations[kind].values())
+            self.default_durations[kind] = statistics.median(known) if known else 0.0
+
+        duration = self.durations[kind].get(name, self.default_durations[kind])
+        return name not in self.failed[kind], -duration
+
+    def schedule(self, kind, items, name=lambda item: item):
+        return sorted(items, key=lambda item: self.priority(kind, name(item)))
+
+    def save(self):
+        # Written to a temporary file first as concurrent runs share the history
+        stored = {
+            "durations": self.durations,
+            "failed": {kind: sorted(failed) for kind, failed in self.failed.items()},
+        }
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(stored, file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,424 @@
+import ast
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from tqdm import tqdm
+
+from simc_test.helpers import default_jobs, get_cache_dir, run_in_pool
+from simc_test.codetests.backends import compile_inprocess
+from simc_test.codetests.cache import get_simc_dir, sha256_file
+from simc_test.codetests.corpus import CorpusError, get_corpus, list_corpus
+from simc_test.unittests.collection import list_test_ids
+
+# Name standing for the code of a module outside of its functions
+MODULE_LEVEL = "<module>"
+
+
+class ImpactError(Exception):
+    pass
+
+
+class FunctionIndexer(ast.NodeTransformer):
+    """
+    Hashes every function of a module and records the lines it spans, function bodies are
+    emptied on the way so that what remains of the module hashes its module level code
+    """
+
+    def __init__(self):
+        self.scope = []
+        self.hashes = {}
+        self.ranges = []
+
+    def visit_ClassDef(self, node):
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        self.scope.pop()
+
+        return node
+
+    def visit_FunctionDef(self, node):
+        # ast.dump leaves out line numbers and comments, moving a function is no change
+        qualname = ".".join(self.scope + [node.name])
+        start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+        self.hashes[qualname] = hashlib.sha256(ast.dump(node).encode()).hexdigest()
+        self.ranges.append((start, node.end_lineno, qualname))
+
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        self.scope.pop()
+        node.body = [ast.Pass()]
+
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+
+def index_source(source_code):
+    # Hash of every function and of the module level code, plus the lines of the functions
+    try:
+        tree = ast.parse(source_code)
+    except SyntaxError:
+        module_hash = hashlib.sha256(source_code.encode()).hexdigest()
+        return {MODULE_LEVEL: module_hash}, []
+
+    indexer = FunctionIndexer()
+    tree = indexer.visit(tree)
+    indexer.hashes[MODULE_LEVEL] = hashlib.sha256(ast.dump(tree).encode()).hexdigest()
+
+    return indexer.hashes, indexer.ranges
+
+
+def read_source(file_path):
+    with open(file_path, encoding="utf-8") as file:
+        return file.read()
+
+
+def list_simc_modules(simc_dir):
+    # Paths of the simc modules relative to the simc package, with / as separator
+    file_paths = glob.glob(os.path.join(simc_dir, "**", "*.py"), recursive=True)
+    return sorted(
+        os.path.relpath(file_path, simc_dir).replace(os.sep, "/") for file_path in file_paths
+    )
+
+
+def get_simc_imports(source_code, module, simc_modules):
+    # simc modules imported anywhere in the source, also inside functions. module is the
+    # path of a simc module, for relative imports, or None for code outside of simc
+    try:
+        tree = ast.parse(source_code)
+    except SyntaxError:
+        return set()
+
+    def to_paths(parts):
+        path = "/".join(parts)
+        return {path + ".py", path + "/__init__.py"}
+
+    package = module.split("/")[:-1] if module is not None else []
+    candidates = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                parts = alias.name.split(".")
+                if parts[0] == "simc":
+                    candidates |= to_paths(parts[1:])
+        elif isinstance(node, ast.ImportFrom):
+            parts = node.module.split(".") if node.module else []
+            if node.level > 0:
+                if module is None:
+                    continue
+                base = package[: len(package) - (node.level - 1)] + parts
+            elif parts and parts[0] == "simc":
+                base = parts[1:]
+            else:
+                continue
+            candidates |= to_paths(base)
+            for alias in node.names:
+                candidates |= to_paths(base + [alias.name])
+
+    return candidates & set(simc_modules)
+
+
+def get_importers(simc_dir, modules):
+    # The simc modules importing any of modules, directly or through other simc modules,
+    # together with modules themselves
+    simc_modules = list_simc_modules(simc_dir)
+    importers_of = {}
+    for module in simc_modules:
+        source_code = read_source(os.path.join(simc_dir, module))
+        for imported in get_simc_imports(source_code, module, simc_modules):
+            importers_of.setdefault(imported, set()).add(module)
+
+    importers = set()
+    todo = list(modules)
+    while todo:
+        module = todo.pop()
+        if module not in importers:
+            importers.add(module)
+            todo += importers_of.get(module, ())
+
+    return importers
+
+
+class CallRecorder:
+    """
+    Records the simc functions called while it is active, functions are identified by
+    their file and first line during the run and resolved to their names afterwards
+    """
+
+    def __init__(self, simc_dir):
+        self.simc_dir = os.path.join(simc_dir, "")
+        self.calls = set()
+
+    def __profile(self, frame, event, arg):
+        if event == "call" and frame.f_code.co_filename.startswith(self.simc_dir):
+            self.calls.add((frame.f_code.co_filename, frame.f_code.co_firstlineno))
+
+    def __enter__(self):
+        sys.setprofile(self.__profile)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(None)
+
+    def functions(self):
+        # Calls resolved to the innermost function spanning their first line, code outside
+        # of any function (module bodies, class bodies) is the module level code
+        ranges = {}
+        functions = set()
+        for file_path, line in self.calls:
+            if file_path not in ranges:
+                _, ranges[file_path] = index_source(read_source(file_path))
+
+            qualname = MODULE_LEVEL
+            innermost = 0
+            for start, end, name in ranges[file_path]:
+                if start <= line <= end and start >= innermost:
+                    qualname = name
+                    innermost = start
+
+            module = os.path.relpath(file_path, self.simc_dir).replace(os.sep, "/")
+            functions.add(f"{module}:{qualname}")
+
+        return sorted(functions)
+
+
+def record_unit_test(test_id):
+    suite = unittest.defaultTestLoader.loadTestsFromName(test_id)
+    with CallRecorder(get_simc_dir()) as recorder:
+        suite.run(unittest.TestResult())
+
+    return test_id, recorder.functions()
+
+
+def record_corpus_file(file):
+    with CallRecorder(get_simc_dir()) as recorder:
+        compile_inprocess(file)
+
+    return os.path.basename(file), sha256_file(file), recorder.functions()
+
+
+def get_impact_map_path(simc_dir):
+    # One map per simc installation, a fork and the released compiler differ
+    simc_dir_hash = hashlib.sha256(os.path.abspath(simc_dir).encode()).hexdigest()
+    return os.path.join(get_cache_dir("impact"), f"{simc_dir_hash[:16]}.json")
+
+
+def record_impact(jobs=None, corpus=None, refresh_corpus=False):
+    # Run every unit test and corpus file under the call recorder and store the simc
+    # functions each of them executes, together with the hashes of all simc functions
+    if jobs is None:
+        jobs = default_jobs()
+
+    simc_dir = get_simc_dir()
+
+    try:
+        files = list_corpus(get_corpus(corpus, refresh=refresh_corpus))
+    except CorpusError as e:
+        print(f"\033[91mCould not get the sim-C codes: {e}\033[m")
+        return False
+
+    impact_map = {"simc_dir": simc_dir, "modules": {}, "unit": {}, "code": {}}
+    for module in list_simc_modules(simc_dir):
+        file_path = os.path.join(simc_dir, module)
+        hashes, _ = index_source(read_source(file_path))
+        impact_map["modules"][module] = {
+            "mtime": os.path.getmtime(file_path),
+            "functions": hashes,
+        }
+
+    test_ids = list_test_ids()
+    with tqdm(total=len(test_ids) + len(files)) as progress:
+        for test_id, functions in run_in_pool(record_unit_test, test_ids, jobs):
+            impact_map["unit"][test_id] = functions
+            progress.update()
+
+        for filename, sha, functions in run_in_pool(record_corpus_file, files, jobs):
+            impact_map["code"][filename] = {"sha": sha, "functions": functions}
+            progress.update()
+
+    impact_map_path = get_impact_map_path(simc_dir)
+    with open(impact_map_path + ".tmp", "w") as file:
+        json.dump(impact_map, file)
+    os.replace(impact_map_path + ".tmp", impact_map_path)
+
+    print(
+        f"\033[92mRecorded the simc functions run by {len(test_ids)} unit tests and "
+        f"{len(files)} code tests in {impact_map_path}!\033[m"
+    )
+
+
+def changed_functions(old_hashes, new_hashes, module):
+    return {
+        f"{module}:{qualname}"
+        for qualname in set(old_hashes) | set(new_hashes)
+        if old_hashes.get(qualname) != new_hashes.get(qualname)
+    }
+
+
+def git(*args):
+    process = subprocess.run(
+        ["git", *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if process.returncode != 0:
+        raise ImpactError(process.stderr.strip())
+
+    return process.stdout
+
+
+def get_changed_since(simc_dir, rev):
+    # Functions whose code differs between rev and the working tree of the simc checkout
+    if not os.path.isdir(simc_dir):
+        raise ImpactError(f"simc directory {simc_dir} does not exist")
+
+    top_dir = git("-C", simc_dir, "rev-parse", "--show-toplevel").strip()
+    prefix = os.path.relpath(os.path.realpath(simc_dir), os.path.realpath(top_dir))
+    names = git("-C", top_dir, "diff", "--name-only", rev, "--", prefix).splitlines()
+
+    changed = set()
+    for name in names:
+        if not name.endswith(".py"):
+            continue
+
+        module = os.path.relpath(name, prefix).replace(os.sep, "/")
+        try:
+            old_source = git("-C", top_dir, "show", f"{rev}:{name}")
+        except ImpactError:
+            old_source = ""
+
+        file_path = os.path.join(top_dir, name)
+        new_source = read_source(file_path) if os.path.exists(file_path) else ""
+
+        old_hashes, _ = index_source(old_source)
+        new_hashes, _ = index_source(new_source)
+        changed |= changed_functions(old_hashes, new_hashes, module)
+
+    return changed
+
+
+def get_changed_since_recording(simc_dir, modules):
+    # Functions whose code differs from when the impact map was recorded, only modules
+    # with a new modification time are parsed again
+    changed = set()
+    for module in set(modules) | set(list_simc_modules(simc_dir)):
+        file_path = os.path.join(simc_dir, module)
+        recorded = modules.get(module, {"mtime": None, "functions": {}})
+
+        if not os.path.exists(file_path):
+            changed |= changed_functions(recorded["functions"], {}, module)
+        elif os.path.getmtime(file_path) != recorded["mtime"]:
+            hashes, _ = index_source(read_source(file_path))
+            changed |= changed_functions(recorded["functions"], hashes, module)
+
+    return changed
+
+
+class Impact:
+    """
+    Recorded impact map together with the simc functions that changed, selects the unit
+    tests and corpus files which have to run again
+    """
+
+    def __init__(self, impact_map, changed):
+        self.impact_map = impact_map
+        self.changed = changed
+
+        # Module level code runs on import, before any test is recorded, so a change of it
+        # affects every module importing the changed one and everything using those
+        simc_dir = impact_map["simc_dir"]
+        changed_modules = {
+            function.split(":")[0]
+            for function in changed
+            if function.endswith(f":{MODULE_LEVEL}")
+        }
+        self.affected_modules = get_importers(simc_dir, changed_modules)
+        self.simc_modules = list_simc_modules(simc_dir)
+        self.test_module_imports = {}
+
+    def is_affected(self, functions):
+        # Nothing recorded means simc ran out of sight, e.g. as the simc command, so any
+        # change may matter
+        if not functions:
+            return True
+
+        for function in functions:
+            module = function.split(":")[0]
+            if function in self.changed or module in self.affected_modules:
+                return True
+
+        return False
+
+    def imports_affected_module(self, test_id):
+        # A test may use what a simc module defines at module level, like a constant,
+        # without calling any of its functions
+        test_module = test_id.rsplit(".", 2)[0]
+        if test_module not in self.test_module_imports:
+            spec = importlib.util.find_spec(test_module)
+            source_code = read_source(spec.origin) if spec and spec.origin else ""
+            self.test_module_imports[test_module] = get_simc_imports(
+                source_code, None, self.simc_modules
+            )
+
+        return bool(self.test_module_imports[test_module] & self.affected_modules)
+
+    def select_test_ids(self, test_ids):
+        # Tests missing from the map were added after recording and always run
+        recorded = self.impact_map["unit"]
+        return [
+            test_id
+            for test_id in test_ids
+            if test_id not in recorded
+            or self.is_affected(recorded[test_id])
+            or self.imports_affected_module(test_id)
+        ]
+
+    def select_corpus_files(self, files):
+        # New or edited corpus files always run
+        recorded = self.impact_map["code"]
+        selected = []
+        for file in files:
+            entry = recorded.get(os.path.basename(file))
+            if (
+                entry is None
+                or entry["sha"] != sha256_file(file)
+                or self.is_affected(entry["functions"])
+            ):
+                selected.append(file)
+
+        return selected
+
+
+def get_impact(changed_since=None):
+    # Changed functions are taken from git when a revision is given and from the
+    # modification times and hashes stored in the impact map otherwise
+    simc_dir = get_simc_dir()
+    impact_map_path = get_impact_map_path(simc_dir)
+    if not os.path.exists(impact_map_path):
+        print("\033[91mNo impact map for this simc, record one with --record-impact\033[m")
+        return None
+
+    with open(impact_map_path) as file:
+        impact_map = json.load(file)
+
+    try:
+        if changed_since is not None:
+            changed = get_changed_since(simc_dir, changed_since)
+        else:
+            changed = get_changed_since_recording(simc_dir, impact_map["modules"])
+    except ImpactError as e:
+        print(f"\033[91mCould not find the changes of simc: {e}\033[m")
+        return None
+
+    print(f"\033[1;37;0m{len(changed)} changed simc functions\033[m")
+    for function in sorted(changed):
+        print(f"    {function}")
+
+    return Impact(impact_map, changed)
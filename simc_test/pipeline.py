@@ -0,0 +1,156 @@
+import contextlib
+import io
+import os
+
+import simc.compiler
+from simc.symbol_table import SymbolTable
+from simc.lexical_analyzer import LexicalAnalyzer
+from simc.parser.simc_parser import parse
+from simc.compiler import compile
+
+
+class SourceLexicalAnalyzer(LexicalAnalyzer):
+    """
+    Lexical analyzer which reads sim-C source code from a string instead of a file, imported
+    modules are still read from their files
+    """
+
+    def __init__(self, source_code, symbol_table, source_filename="<string>"):
+        super().__init__(source_filename, symbol_table)
+        self.source_code_string = source_code
+
+    def update_filename(self, source_filename):
+        super().update_filename(source_filename)
+        self.source_code_string = None
+
+    def _LexicalAnalyzer__read_source_code(self):
+        if self.source_code_string is None:
+            return super()._LexicalAnalyzer__read_source_code()
+
+        # Add end of string character to indicate end of source code
+        return self.source_code_string + "\0"
+
+
+class MemoryFile(io.StringIO):
+    # Text file whose contents end up in a dictionary when it is closed
+    def __init__(self, files, filename):
+        super().__init__()
+        self.files = files
+        self.filename = filename
+
+    def close(self):
+        if not self.closed:
+            self.files[self.filename] = self.getvalue()
+        super().close()
+
+
+@contextlib.contextmanager
+def generated_files():
+    # simc.compiler.compile writes the C code with open(c_filename, "w"), a module level
+    # open shadowing the builtin one collects the written files in memory instead
+    files = {}
+
+    def memory_open(filename, mode="r", *args, **kwargs):
+        if "w" not in mode:
+            return open(filename, mode, *args, **kwargs)
+        return MemoryFile(files, filename)
+
+    simc.compiler.open = memory_open
+    try:
+        yield files
+    finally:
+        del simc.compiler.open
+
+
+def get_c_filename(filename):
+    # Same naming rule as simc, hello.simc -> hello.c
+    return "".join(filename.split(".")[:-1]) + ".c"
+
+
+def lex_source(lexical_analyzer):
+    tokens, module_source_paths = lexical_analyzer.lexical_analyze()
+
+    # Tokens of the imported modules are generated with the same lexical analyzer
+    all_module_tokens = {}
+    for module_source_path in module_source_paths:
+        module_name = os.path.basename(module_source_path).split(".")[0]
+
+        lexical_analyzer.update_filename(module_source_path)
+        all_module_tokens[module_name], _ = lexical_analyzer.lexical_analyze()
+
+    return tokens, all_module_tokens
+
+
+def parse_tokens(tokens, all_module_tokens, table):
+    # Modules are parsed first as their function definitions are needed by the calls
+    all_module_opcodes = {}
+    for module_name, module_tokens in all_module_tokens.items():
+        all_module_opcodes[module_name] = parse(module_tokens, table)
+
+    opcodes = parse(tokens, table)
+
+    return opcodes, prune_module_opcodes(all_module_opcodes, table)
+
+
+def prune_module_opcodes(all_module_opcodes, table):
+    # Drop the functions of modules which were never called, mirrors simc.simc.run
+    all_module_opcodes_pruned = {}
+    for module_name, module_opcodes in all_module_opcodes.items():
+        all_module_opcodes_pruned[module_name] = []
+        i = 0
+
+        while i < len(module_opcodes):
+            if module_opcodes[i].type == "func_decl":
+                func_name = module_opcodes[i].val.split("---")[0].strip()
+                func_symbol_table_val = table.symbol_table.get(
+                    table.get_by_symbol(func_name)
+                )
+                func_ret_type = func_symbol_table_val[1]
+
+                if func_ret_type == "not_known" or type(func_ret_type) == list:
+                    while module_opcodes[i].type != "scope_over":
+                        i += 1
+                else:
+                    all_module_opcodes_pruned[module_name].append(module_opcodes[i])
+            else:
+                all_module_opcodes_pruned[module_name].append(module_opcodes[i])
+            i += 1
+
+    return all_module_opcodes_pruned
+
+
+def compile_opcodes(opcodes, all_module_opcodes, c_filename, table):
+    compile(opcodes, c_filename, table)
+
+    # Module functions are compiled into headers next to the C file which includes them
+    output_dir = os.path.dirname(c_filename)
+    for module_name, module_opcodes in all_module_opcodes.items():
+        compile(module_opcodes, os.path.join(output_dir, module_name + ".h"), table)
+
+
+def compile_to_string(opcodes, table):
+    # C code generated for the opcodes, without writing it to a file
+    with generated_files() as files:
+        compile(opcodes, "<string>.c", table)
+
+    return files["<string>.c"]
+
+
+def compile_simc_source(source_code, c_filename, stage=None):
+    # Run the lexical analyzer, parser and compiler of simc in the current process, this
+    # is what the simc command does minus its display options. The generated C file and
+    # module headers are returned as a dictionary of filename to contents. stage(name)
+    # returns a context manager wrapping that stage, to profile it for example
+    if stage is None:
+        stage = contextlib.nullcontext
+
+    table = SymbolTable()
+
+    with stage("lexical_analyze"):
+        tokens, all_module_tokens = lex_source(SourceLexicalAnalyzer(source_code, table))
+    with stage("parse"):
+        opcodes, all_module_opcodes = parse_tokens(tokens, all_module_tokens, table)
+    with stage("compile"), generated_files() as files:
+        compile_opcodes(opcodes, all_module_opcodes, c_filename, table)
+
+    return files
@@ -0,0 +1,154 @@
+import contextlib
+import cProfile
+import os
+import pstats
+
+import simc
+
+# Stages of compile_simc_source which are profiled separately
+STAGES = ["lexical_analyze", "parse", "compile"]
+
+# Call paths with less than this share of a root's time are left out of collapsed stacks
+MIN_PATH_SHARE = 0.0001
+
+# Number of functions listed as the hottest of the corpus
+HOT_FUNCTIONS_REPORT_SIZE = 15
+
+SIMC_DIR = os.path.dirname(os.path.abspath(simc.__file__))
+
+
+class StageProfiler:
+    """
+    Profiles every stage of the pipeline separately with cProfile, the profiles of one file
+    are written to <stage>.pstats and <stage>.collapsed in a directory of that file
+    """
+
+    def __init__(self, profile_dir):
+        self.profile_dir = profile_dir
+        self.profiles = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.profiles[name] = profile
+
+    def write(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        for name, profile in self.profiles.items():
+            path = os.path.join(self.profile_dir, name)
+            profile.dump_stats(path + ".pstats")
+            write_collapsed(pstats.Stats(profile), path + ".collapsed")
+
+
+@contextlib.contextmanager
+def profile_stages(file, profile_dir):
+    # Stage wrapper for compile_simc_source profiling the stages of file, None without a
+    # profile directory. Stages which ran are written even when the compile fails
+    if profile_dir is None:
+        yield None
+        return
+
+    profiler = StageProfiler(os.path.join(profile_dir, os.path.basename(file)))
+    try:
+        yield profiler.stage
+    finally:
+        profiler.write()
+
+
+def get_label(func):
+    # Frame names of flamegraph tools cannot contain ";", simc files are named relative to
+    # the simc package and others by their filename only
+    filename, line, name = func
+    if filename == "~":
+        label = name
+    elif filename.startswith(SIMC_DIR):
+        label = f"simc/{os.path.relpath(filename, SIMC_DIR)}:{line}({name})"
+    else:
+        label = f"{os.path.basename(filename)}:{line}({name})"
+
+    return label.replace(";", ",")
+
+
+def collapse_stacks(stats):
+    # cProfile keeps the time of every caller to callee edge but not whole stacks, so the
+    # stacks are rebuilt by walking down from the functions nobody called. Every function
+    # splits its own and its callees' time over the paths reaching it by the time of the
+    # edge each path came in through. Recursion is cut where a function is already on the
+    # stack, its time stays with the outer call
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, edge_time) in callers.items():
+            callees.setdefault(caller, []).append((func, edge_time))
+
+    stacks = {}
+
+    def walk(func, path, path_time, min_time):
+        _, _, own_time, total_time, _ = stats.stats[func]
+        share = path_time / total_time if total_time else 1.0
+        path = path + [get_label(func)]
+
+        self_time = own_time * share
+        if self_time > 0:
+            key = ";".join(path)
+            stacks[key] = stacks.get(key, 0.0) + self_time
+
+        for callee, edge_time in callees.get(func, []):
+            callee_time = edge_time * share
+            if callee_time >= min_time and get_label(callee) not in path:
+                walk(callee, path, callee_time, min_time)
+
+    for func, (_, _, _, total_time, callers) in stats.stats.items():
+        if not any(caller in stats.stats for caller in callers):
+            walk(func, [], total_time, total_time * MIN_PATH_SHARE)
+
+    return stacks
+
+
+def write_collapsed(stats, path):
+    # One "frame;frame;frame microseconds" line per stack, the format flamegraph.pl,
+    # speedscope and inferno read
+    with open(path, "w") as file:
+        for stack, seconds in sorted(collapse_stacks(stats).items()):
+            microseconds = round(seconds * 1e6)
+            if microseconds > 0:
+                file.write(f"{stack} {microseconds}\n")
+
+
+def combine_profiles(profile_dir, filenames):
+    # One profile of every stage of every file, written next to the profiles of the files
+    paths = [
+        os.path.join(profile_dir, filename, stage + ".pstats")
+        for filename in filenames
+        for stage in STAGES
+    ]
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return None
+
+    combined = pstats.Stats(*paths)
+    combined.dump_stats(os.path.join(profile_dir, "combined.pstats"))
+    write_collapsed(combined, os.path.join(profile_dir, "combined.collapsed"))
+
+    return combined
+
+
+def print_hot_functions(stats):
+    # The simc functions which took the most time of their own across the corpus
+    hot_functions = sorted(
+        (
+            (own_time, total_time, calls, func)
+            for func, (_, calls, own_time, total_time, _) in stats.stats.items()
+            if func[0].startswith(SIMC_DIR)
+        ),
+        reverse=True,
+    )
+
+    print(f"\033[1;37;0m{'Own (s)':>10}{'Total (s)':>11}{'Calls':>10}  Function")
+    for own_time, total_time, calls, func in hot_functions[:HOT_FUNCTIONS_REPORT_SIZE]:
+        print(f"{own_time:>10.3f}{total_time:>11.3f}{calls:>10}  {get_label(func)}")
+    print("\033[m", end="")
@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+from xml.sax.saxutils import escape, quoteattr
+
+# Colors of simc and characters XML 1.0 cannot hold are dropped from the error text
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+INVALID_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# Pipeline stage checked by the unit tests of a module
+UNIT_TEST_STAGES = {
+    "simc_test.unittests.test_lexical_analyzer": "lexical_analyze",
+    "simc_test.unittests.parser": "parse",
+    "simc_test.unittests.test_compiler": "compile",
+}
+
+
+def clean_text(text):
+    return INVALID_XML_CHARS.sub("", ANSI_ESCAPE.sub("", text))
+
+
+def get_unit_test_stage(test_id):
+    for module, stage in UNIT_TEST_STAGES.items():
+        if test_id.startswith(module + "."):
+            return stage
+    return None
+
+
+def unit_record(reports, duration):
+    # One record per test, the outcomes of its subtests decide the outcome of the test.
+    # error is the traceback of failures and errors or the reason of a skip
+    test_id = reports[0][1]
+    outcomes = [outcome for outcome, *_ in reports]
+    if "error" in outcomes:
+        outcome = "error"
+    elif "failure" in outcomes or "unexpected_success" in outcomes:
+        outcome = "failed"
+    elif all(outcome == "skip" for outcome in outcomes):
+        outcome = "skipped"
+    else:
+        outcome = "passed"
+
+    error = "\n".join(
+        details
+        for report_outcome, _, _, details in reports
+        if report_outcome in ("error", "failure", "skip") and details
+    )
+
+    return {
+        "kind": "unit",
+        "name": test_id,
+        "outcome": outcome,
+        "duration": duration,
+        "stage": get_unit_test_stage(test_id),
+        "error": clean_text(error),
+    }
+
+
+def code_record(filename, result, duration):
+    # Results replayed from the result cache have no duration, stage is the stage simc was
+    # in when the file failed or timed out, when it is known
+    passed = result["outcome"] == "passed"
+    return {
+        "kind": "code",
+        "name": filename,
+        "outcome": result["outcome"],
+        "duration": duration,
+        "stage": None if passed else result.get("stage"),
+        "error": "" if passed else clean_text(result["output"]),
+    }
+
+
+class NdjsonReporter:
+    """
+    Writes one JSON record per unit test or code test as soon as it finished, so that
+    a CI job can follow a run while it is going
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "w")
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def add_unit(self, reports, duration):
+        self.write(unit_record(reports, duration))
+
+    def add_code(self, filename, result, duration):
+        self.write(code_record(filename, result, duration))
+
+    def close(self):
+        self.file.close()
+
+
+class JUnitReporter:
+    """
+    Writes a JUnit XML report with a test suite for the unit tests and one for the code
+    tests. The test cases are spooled to a temporary file per suite as they finish, the
+    report is put together once the counts of the suites are known
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.suites = {}
+
+    def get_suite(self, kind):
+        if kind not in self.suites:
+            self.suites[kind] = {
+                "spool": tempfile.TemporaryFile("w+", encoding="utf-8"),
+                "tests": 0,
+                "failures": 0,
+                "errors": 0,
+                "skipped": 0,
+                "time": 0.0,
+            }
+        return self.suites[kind]
+
+    def write(self, record, classname, name):
+        suite = self.get_suite(record["kind"])
+        duration = record["duration"] or 0.0
+        suite["tests"] += 1
+        suite["time"] += duration
+
+        # Code tests which failed or timed out are typed by the stage of simc they were in
+        error_type = record["stage"] or record["kind"]
+        message = get_message(record["error"])
+        if record["outcome"] == "failed":
+            suite["failures"] += 1
+            element = "failure"
+        elif record["outcome"] in ("error", "timeout"):
+            suite["errors"] += 1
+            element = "error"
+            if record["outcome"] == "timeout":
+                error_type = "timeout"
+        elif record["outcome"] == "skipped":
+            suite["skipped"] += 1
+            element = "skipped"
+        else:
+            element = None
+
+        spool = suite["spool"]
+        spool.write(
+            f"    <testcase classname={quoteattr(classname)} name={quoteattr(name)} "
+            f'time="{duration:.6f}"'
+        )
+        if element is None:
+            spool.write("/>\n")
+            return
+
+        spool.write(">\n")
+        spool.write(
+            f"      <{element} type={quoteattr(error_type)} message={quoteattr(message)}>"
+            f"{escape(record['error'])}</{element}>\n"
+        )
+        spool.write("    </testcase>\n")
+
+    def add_unit(self, reports, duration):
+        record = unit_record(reports, duration)
+        classname, _, name = record["name"].rpartition(".")
+        self.write(record, classname, name)
+
+    def add_code(self, filename, result, duration):
+        self.write(code_record(filename, result, duration), "code", filename)
+
+    def close(self):
+        # Written to a temporary file first so that a half written report is never read
+        totals = {
+            key: sum(suite[key] for suite in self.suites.values())
+            for key in ("tests", "failures", "errors", "skipped", "time")
+        }
+
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+            file.write(f'<testsuites name="simc-test" {get_counts(totals)}>\n')
+            for kind, suite in self.suites.items():
+                file.write(f'  <testsuite name="{kind}" {get_counts(suite)}>\n')
+                suite["spool"].seek(0)
+                shutil.copyfileobj(suite["spool"], file)
+                suite["spool"].close()
+                file.write("  </testsuite>\n")
+            file.write("</testsuites>\n")
+        os.replace(temp_path, self.path)
+
+
+def get_message(error):
+    # The exception line of the last traceback in the error, otherwise its first line
+    lines = error.strip().split("\n")
+    starts = [i for i, line in enumerate(lines) if line.startswith("Traceback ")]
+    if starts:
+        for line in lines[starts[-1] + 1 :]:
+            if not line.startswith(" "):
+                return line
+
+    return lines[0]
+
+
+def get_counts(suite):
+    return (
+        f'tests="{suite["tests"]}" failures="{suite["failures"]}" '
+        f'errors="{suite["errors"]}" skipped="{suite["skipped"]}" time="{suite["time"]:.6f}"'
+    )
+
+
+def get_reporters(ndjson_path=None, junit_path=None):
+    reporters = []
+    if ndjson_path is not None:
+        reporters.append(NdjsonReporter(ndjson_path))
+    if junit_path is not None:
+        reporters.append(JUnitReporter(junit_path))
+
+    return reporters
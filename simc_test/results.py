@@ -0,0 +1,116 @@
+import json
+import unittest
+
+from simc_test.history import DurationHistory
+
+
+def unit_test_passed(reports):
+    return all(outcome in ("success", "skip", "expected_failure") for outcome, *_ in reports)
+
+
+def code_test_passed(result):
+    return result["outcome"] == "passed"
+
+
+class Results:
+    """
+    Outcomes of one run, written with --results so that the runs of several shards can
+    be merged into a single summary. Every outcome is passed on to the reporters as soon
+    as it is added
+    """
+
+    def __init__(self, reporters=()):
+        self.unit = []
+        self.code = {}
+        self.durations = {"unit": {}, "code": {}}
+        self.failed = {"unit": [], "code": []}
+        self.reporters = reporters
+
+    def add_unit(self, reports, duration):
+        for reporter in self.reporters:
+            reporter.add_unit(reports, duration)
+
+        test_id = reports[0][1]
+        self.unit.append(reports)
+        self.durations["unit"][test_id] = duration
+        if not unit_test_passed(reports):
+            self.failed["unit"].append(test_id)
+
+    def add_code(self, filename, result, duration):
+        for reporter in self.reporters:
+            reporter.add_code(filename, result, duration)
+
+        # Results replayed from the result cache come without a duration and tell nothing
+        # new about the file
+        self.code[filename] = result
+        if duration is not None:
+            self.durations["code"][filename] = duration
+            if not code_test_passed(result):
+                self.failed["code"].append(filename)
+
+    def to_dict(self):
+        return {
+            "unit": self.unit,
+            "code": self.code,
+            "durations": self.durations,
+            "failed": self.failed,
+        }
+
+    def write(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            data = json.load(file)
+
+        results = cls()
+        results.unit = data["unit"]
+        results.code = data["code"]
+        results.durations = data["durations"]
+        results.failed = data["failed"]
+
+        return results
+
+    def merge(self, other):
+        self.unit += other.unit
+        self.code.update(other.code)
+        for kind, durations in other.durations.items():
+            self.durations[kind].update(durations)
+            self.failed[kind] += other.failed[kind]
+
+
+def merge_results(paths, history_path=None):
+    # Print one summary for the results of all shards, in the formats of a single run
+    from simc_test.unittests.main import RemoteTestResult, ReplayedTestSuite
+    from simc_test.codetests.main import print_code_summary
+
+    merged = Results()
+    for path in paths:
+        merged.merge(Results.load(path))
+
+    passed = True
+    if merged.unit:
+        print("*" * 50)
+        print("Merged unit test")
+        print("*" * 50)
+        runner = unittest.TextTestRunner(resultclass=RemoteTestResult)
+        all_reports = sorted(merged.unit, key=lambda reports: reports[0][1])
+        result = runner.run(ReplayedTestSuite(all_reports))
+        passed = result.wasSuccessful()
+
+    if merged.code:
+        print("*" * 50)
+        print("Merged code test")
+        print("*" * 50)
+        if not print_code_summary(sorted(merged.code.items())):
+            passed = False
+
+    # The merged durations balance the shards of the next run
+    if history_path is not None:
+        history = DurationHistory(history_path)
+        history.add_results(merged)
+        history.save()
+
+    return passed
@@ -0,0 +1,36 @@
+import hashlib
+import heapq
+import statistics
+
+
+def stable_hash(name):
+    # hash() is salted per process, every node has to agree on the partition
+    return int(hashlib.sha256(name.encode()).hexdigest()[:16], 16)
+
+
+def shard_items(items, shard, durations=None):
+    # Items of shard index out of count. With durations the longest items are handed out
+    # first to the least loaded shard (LPT), items without a duration are assumed to take
+    # the median time. Without any durations items are spread by a stable hash so adding
+    # a test moves no other test. Every node has to use the same durations to agree
+    index, count = shard
+    if count == 1:
+        return list(items)
+
+    known = [durations[item] for item in items if durations and item in durations]
+    if not known:
+        return [item for item in items if stable_hash(item) % count == index - 1]
+
+    default_duration = statistics.median(known)
+    ordered = sorted(items, key=lambda item: (-durations.get(item, default_duration), item))
+
+    # Heap of (load, shard number) so that ties always go to the lowest shard number
+    loads = [(0.0, number) for number in range(count)]
+    selected = set()
+    for item in ordered:
+        load, number = heapq.heappop(loads)
+        if number == index - 1:
+            selected.add(item)
+        heapq.heappush(loads, (load + durations.get(item, default_duration), number))
+
+    return [item for item in items if item in selected]
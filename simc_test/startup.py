@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+
+def measure_imports(module):
+    # Import the module in a fresh interpreter with -X importtime, which reports the self
+    # and cumulative import time of every module in microseconds
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        self_time, cumulative_time, name = line[len("import time:") :].split("|")
+        imports.append((name.strip(), int(self_time), int(cumulative_time)))
+
+    return imports
+
+
+def startup_report(mode_modules, top=10):
+    # Import time of the entry point and of the machinery of every mode, followed by the
+    # modules which spend the most time importing themselves
+    for mode, module in mode_modules.items():
+        imports = measure_imports(module)
+        cumulative_times = {name: cumulative for name, _, cumulative in imports}
+        if module not in cumulative_times:
+            print(f"\033[91m{mode}: {module} could not be imported\033[m")
+            continue
+
+        print(f"\033[1;37;0m{mode} ({module}): {cumulative_times[module] / 1000:.1f} ms\033[m")
+
+        imports.sort(key=lambda entry: entry[1], reverse=True)
+        for name, self_time, cumulative_time in imports[:top]:
+            print(
+                f"    {name:<48}{self_time / 1000:>9.1f} ms self"
+                f"{cumulative_time / 1000:>9.1f} ms cumulative"
+            )
@@ -1,30 +1,611 @@
 import argparse
+import os
+import sys
 
-from simc_test.unittests.main import unit_test
-from simc_test.codetests.main import run_simc_codes
+# Module holding the machinery of every kind of test, they are only imported once their
+# kind of test is selected so that the entry point itself starts quickly
+MODE_MODULES = {
+    "unit": "simc_test.unittests.main",
+    "code": "simc_test.codetests.main",
+    "bench": "simc_test.benchmarks.main",
+    "scaling": "simc_test.benchmarks.scaling",
+    "perf_check": "simc_test.benchmarks.baseline",
+    "record_impact": "simc_test.impact",
+    "watch": "simc_test.watch",
+}
 
 
-def run_tests():
+# Backends of simc_test.codetests.backends, which is only imported once code tests run
+BACKEND_NAMES = ["inprocess", "forkserver", "subprocess"]
+
+
+def parse_backend(backend):
+    # The forkserver backend is only registered where processes can fork, not on Windows
+    if backend == "forkserver" and not hasattr(os, "fork"):
+        raise argparse.ArgumentTypeError(
+            "the forkserver backend is not supported on this platform, use inprocess or "
+            "subprocess"
+        )
+
+    return backend
+
+
+def parse_sizes(sizes):
+    return [int(size) for size in sizes.split(",")]
+
+
+def parse_shard(shard):
+    # "i/N" with shards numbered from 1, as most CI systems number their nodes
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/N, not {shard}")
+
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and {count}")
+
+    return index, count
+
+
+def parse_timeout(timeout):
+    # Seconds per compiled file, 0 waits forever
+    try:
+        seconds = float(timeout)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"timeout must be a number of seconds, not {timeout}")
+
+    if seconds < 0:
+        raise argparse.ArgumentTypeError("timeout cannot be negative")
+
+    return seconds or None
+
+
+def parse_repeat(repeat):
+    # Measured runs, the statistics of a benchmark need at least one
+    try:
+        count = int(repeat)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"number of runs must be a number, not {repeat}")
+
+    if count < 1:
+        raise argparse.ArgumentTypeError("number of runs must be at least 1")
+
+    return count
+
+
+def parse_batch_size(batch_size):
+    # Programs per translation unit, 1 builds every program on its own
+    try:
+        size = int(batch_size)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"batch size must be a number, not {batch_size}")
+
+    if size < 1:
+        raise argparse.ArgumentTypeError("batch size must be at least 1")
+
+    return size if size > 1 else None
+
+
+def run_unit(args):
+    from simc_test.unittests.main import unit_test
+
+    return unit_test(
+        jobs=args.jobs,
+        patterns=args.patterns,
+        classes=args.classes,
+        modules=args.modules,
+        impact=args.impact,
+        shard=args.shard,
+        history=args.duration_history,
+        results=args.run_results,
+    )
+
+
+def run_code(args):
+    from simc_test.codetests.main import run_simc_codes
+
+    return run_simc_codes(
+        jobs=args.jobs,
+        backend=args.backend,
+        corpus=args.corpus,
+        refresh_corpus=args.refresh_corpus,
+        cached=args.cached,
+        impact=args.impact,
+        shard=args.shard,
+        history=args.duration_history,
+        results=args.run_results,
+        timeout=args.timeout,
+        trace_memory=args.trace_memory,
+        profile_dir=args.profile,
+        execute=args.execute,
+        batch_size=args.batch_size,
+    )
+
+
+def run_bench(args):
+    from simc_test.benchmarks.main import run_benchmarks
+
+    return run_benchmarks(
+        sizes=args.bench_sizes,
+        repeat=args.bench_repeat,
+        warmup=args.bench_warmup,
+        time_budget=args.bench_time,
+        seed=args.seed,
+    )
+
+
+def run_scaling(args):
+    from simc_test.benchmarks.scaling import check_scaling
+
+    return check_scaling(
+        sizes=args.scaling_sizes,
+        seed=args.seed,
+        repeat=args.scaling_repeat,
+        warmup=args.scaling_warmup,
+        max_exponent=args.max_exponent,
+    )
+
+
+def run_perf_check(args):
+    from simc_test.benchmarks.baseline import check_performance, update_baseline
+
+    if args.update_baseline:
+        return update_baseline(args.baseline, seed=args.seed)
+
+    return check_performance(
+        args.baseline, threshold=args.perf_threshold, alpha=args.perf_alpha
+    )
+
+
+def run_record_impact(args):
+    from simc_test.impact import record_impact
+
+    return record_impact(
+        jobs=args.jobs, corpus=args.corpus, refresh_corpus=args.refresh_corpus
+    )
+
+
+def run_watch(args):
+    from simc_test.watch import watch
+
+    return watch(
+        patterns=args.patterns,
+        classes=args.classes,
+        modules=args.modules,
+        corpus=args.corpus,
+        refresh_corpus=args.refresh_corpus,
+    )
+
+
+def get_parser():
     parser = argparse.ArgumentParser(description="sim-C Test Suite")
     parser.add_argument("--unit", "-u", action="store_true")
     parser.add_argument("--code", "-c", action="store_true")
+    parser.add_argument(
+        "--bench",
+        action="store_true",
+        help="time the lexical analyzer, parser and compiler on generated programs",
+    )
+    parser.add_argument(
+        "--scaling",
+        action="store_true",
+        help="fail when lexical analysis or parsing time grows superlinearly with input size",
+    )
+    parser.add_argument(
+        "--perf-check",
+        action="store_true",
+        help="fail when a pipeline stage is significantly slower than the stored baseline",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        help="number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--backend",
+        type=parse_backend,
+        choices=BACKEND_NAMES,
+        default="inprocess",
+        help="how code tests are compiled: inprocess, forkserver (a forked child per file) or "
+        "subprocess (the simc command per file)",
+    )
+    parser.add_argument(
+        "--corpus",
+        metavar="PATH",
+        help="directory of .simc files to use for code tests instead of sim-C's simc-codes",
+    )
+    parser.add_argument(
+        "--refresh-corpus",
+        action="store_true",
+        help="update the cached sim-C clone before running code tests",
+    )
+    parser.add_argument(
+        "--cached",
+        action="store_true",
+        help="only compile code tests whose source or compiler changed since the last run",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=parse_timeout,
+        default=60.0,
+        metavar="SECONDS",
+        help="stop compiling a code test after this long and report it as timed out, 0 "
+        "for no limit (default: 60)",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="measure the peak memory of in-process code tests with tracemalloc, which is "
+        "much slower. The other backends always measure the peak RSS",
+    )
+    parser.add_argument(
+        "--execute",
+        action="store_true",
+        help="build the C code generated for every code test with cc (or $CC), run it and "
+        "compare its output with the .expected file next to the .simc file",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=parse_batch_size,
+        metavar="N",
+        help="with --execute, build the programs N at a time as one translation unit so "
+        "the C compiler starts once per batch. Failures are still reported per program",
+    )
+    parser.add_argument(
+        "--ndjson",
+        metavar="PATH",
+        help="write a JSON line for every unit test and code test as soon as it finished",
+    )
+    parser.add_argument(
+        "--junit-xml",
+        metavar="PATH",
+        help="write a JUnit XML report of the unit tests and code tests",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="profile the lexical analyzer, parser and compiler for every code test and "
+        "all of them combined, as .pstats files and collapsed stacks for flamegraphs",
+    )
+    parser.add_argument(
+        "-k",
+        dest="patterns",
+        action="append",
+        metavar="PATTERN",
+        help="only run unit tests whose id matches the pattern, like unittest's -k (repeatable)",
+    )
+    parser.add_argument(
+        "--class",
+        dest="classes",
+        action="append",
+        metavar="PATTERN",
+        help="only run unit test classes matching the pattern, e.g. TestLoopParser (repeatable)",
+    )
+    parser.add_argument(
+        "--module",
+        dest="modules",
+        action="append",
+        metavar="PATTERN",
+        help="only run unit tests of modules matching the pattern, e.g. parser (repeatable)",
+    )
+    parser.add_argument(
+        "--bench-sizes",
+        type=parse_sizes,
+        default=[1000, 10000, 100000],
+        metavar="N,N,...",
+        help="lines of the generated benchmark programs (default: 1000,10000,100000)",
+    )
+    parser.add_argument(
+        "--bench-repeat",
+        type=parse_repeat,
+        default=10,
+        help="measured runs per program size (default: 10)",
+    )
+    parser.add_argument(
+        "--bench-warmup",
+        type=int,
+        default=1,
+        help="unmeasured runs per program size (default: 1)",
+    )
+    parser.add_argument(
+        "--bench-time",
+        type=float,
+        default=30,
+        help="seconds after which no more runs of a program size are started (default: 30)",
+    )
+    parser.add_argument(
+        "--scaling-sizes",
+        type=parse_sizes,
+        default=[500, 1000, 2000, 4000],
+        metavar="N,N,...",
+        help="lines of the generated programs for the scaling check (default: 500,1000,2000,4000)",
+    )
+    parser.add_argument(
+        "--scaling-repeat",
+        type=parse_repeat,
+        default=10,
+        help="measured rounds over all program sizes of the scaling check, the median of "
+        "the growth exponents of the rounds is checked (default: 10)",
+    )
+    parser.add_argument(
+        "--scaling-warmup",
+        type=int,
+        default=2,
+        help="unmeasured rounds over all program sizes of the scaling check (default: 2)",
+    )
+    parser.add_argument(
+        "--max-exponent",
+        type=float,
+        help="largest accepted growth exponent of the time of every stage in input size "
+        "(default: 1.4 for lexical analysis, 1.55 for parsing)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="seed of the generated programs (default: 0)",
+    )
+    parser.add_argument(
+        "--baseline",
+        default="simc-perf-baseline.json",
+        metavar="PATH",
+        help="JSON file with the performance baseline (default: simc-perf-baseline.json)",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="with --perf-check, measure the current timings and store them as the baseline",
+    )
+    parser.add_argument(
+        "--perf-threshold",
+        type=float,
+        default=0.1,
+        help="slowdown of a stage's median that counts as a regression (default: 0.1)",
+    )
+    parser.add_argument(
+        "--perf-alpha",
+        type=float,
+        default=0.01,
+        help="significance level of the Mann-Whitney U test (default: 0.01)",
+    )
+    parser.add_argument(
+        "--record-impact",
+        action="store_true",
+        help="record which simc functions every unit test and code test runs",
+    )
+    parser.add_argument(
+        "--changed-since",
+        metavar="REV",
+        help="only run the tests affected by the changes of the simc checkout since REV",
+    )
+    parser.add_argument(
+        "--changed",
+        action="store_true",
+        help="only run the tests affected by the simc files modified since --record-impact",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="rerun the tests affected by every change of simc or of the corpus",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="i/N",
+        help="only run the i-th of N deterministic parts of the unit and code tests",
+    )
+    parser.add_argument(
+        "--history",
+        metavar="PATH",
+        help="JSON file with the durations of earlier runs, used to balance the shards "
+        "(default: in the cache directory)",
+    )
+    parser.add_argument(
+        "--results",
+        metavar="PATH",
+        help="write the outcomes of the unit and code tests to a JSON file for merge-results",
+    )
+    parser.add_argument(
+        "--startup-report",
+        action="store_true",
+        help="print how long the entry point and the selected kinds of test take to import",
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    merge_parser = subparsers.add_parser(
+        "merge-results", help="print one summary for the --results files of several shards"
+    )
+    merge_parser.add_argument("paths", nargs="+", metavar="RESULTS")
+    merge_parser.add_argument(
+        "--update-history",
+        metavar="PATH",
+        help="add the merged durations to a history file for balancing the next shards",
+    )
+
+    # Options of the main parser which matter to a subcommand are repeated so that they
+    # can follow it, without a default they leave the main parser's value alone
+    queue_parser = subparsers.add_parser(
+        "serve-queue", help="hand out unit tests and code tests to workers"
+    )
+    queue_parser.add_argument(
+        "--listen",
+        default="127.0.0.1:7557",
+        metavar="ADDR",
+        help="host:port, or a path for a Unix socket (default: 127.0.0.1:7557)",
+    )
+    queue_parser.add_argument(
+        "--unit", "-u", action="store_true", default=argparse.SUPPRESS
+    )
+    queue_parser.add_argument(
+        "--code", "-c", action="store_true", default=argparse.SUPPRESS
+    )
+    for option, dest in [("-k", "patterns"), ("--class", "classes"), ("--module", "modules")]:
+        queue_parser.add_argument(
+            option,
+            dest=dest,
+            action="append",
+            metavar="PATTERN",
+            default=argparse.SUPPRESS,
+        )
+    for option in ["--corpus", "--results", "--history", "--ndjson", "--junit-xml"]:
+        queue_parser.add_argument(option, metavar="PATH", default=argparse.SUPPRESS)
+    queue_parser.add_argument(
+        "--refresh-corpus", action="store_true", default=argparse.SUPPRESS
+    )
+    queue_parser.add_argument(
+        "--timeout", type=parse_timeout, metavar="SECONDS", default=argparse.SUPPRESS
+    )
+    queue_parser.add_argument(
+        "--trace-memory", action="store_true", default=argparse.SUPPRESS
+    )
+    queue_parser.add_argument(
+        "--lease-timeout",
+        type=parse_timeout,
+        default=600.0,
+        metavar="SECONDS",
+        help="hand an item out again when its worker did not send a result after this "
+        "long, 0 for no limit (default: 600)",
+    )
+
+    worker_parser = subparsers.add_parser(
+        "worker", help="run unit tests and code tests handed out by serve-queue"
+    )
+    worker_parser.add_argument(
+        "--connect",
+        required=True,
+        metavar="ADDR",
+        help="address serve-queue listens on",
+    )
+    worker_parser.add_argument("--jobs", "-j", type=int, default=argparse.SUPPRESS)
+    worker_parser.add_argument(
+        "--backend",
+        type=parse_backend,
+        choices=BACKEND_NAMES,
+        default=argparse.SUPPRESS,
+    )
+
+    return parser
+
+
+def run_tests():
+    args = get_parser().parse_args()
+
+    if args.command == "merge-results":
+        from simc_test.results import merge_results
+
+        if not merge_results(args.paths, args.update_history):
+            sys.exit(1)
+        return
+
+    if args.command == "serve-queue":
+        from simc_test.reporters import get_reporters
+        from simc_test.workqueue import serve_queue
+
+        # Both kinds of test are handed out unless one was selected, selecting unit tests
+        # by name implies only unit tests are wanted like without a subcommand
+        names = args.patterns or args.classes or args.modules
+        unit = args.unit or not args.code
+        code = args.code or not (args.unit or names)
+        reporters = get_reporters(args.ndjson, args.junit_xml)
+        passed = serve_queue(
+            args.listen,
+            results_path=args.results,
+            history_path=args.history,
+            reporters=reporters,
+            lease_timeout=args.lease_timeout,
+            unit=unit,
+            code=code,
+            patterns=args.patterns,
+            classes=args.classes,
+            modules=args.modules,
+            corpus=args.corpus,
+            refresh_corpus=args.refresh_corpus,
+            timeout=args.timeout,
+            trace_memory=args.trace_memory,
+        )
+        for reporter in reporters:
+            reporter.close()
+        if not passed:
+            sys.exit(1)
+        return
+
+    if args.command == "worker":
+        from simc_test.workqueue import work
+
+        if work(args.connect, jobs=args.jobs, backend=args.backend) is False:
+            sys.exit(1)
+        return
+
+    args_with_func = {
+        "unit": run_unit,
+        "code": run_code,
+        "bench": run_bench,
+        "scaling": run_scaling,
+        "perf_check": run_perf_check,
+        "record_impact": run_record_impact,
+        "watch": run_watch,
+    }
+
+    # Run unit and code tests when nothing was selected explicitly, selecting unit tests by
+    # name implies only unit tests are wanted
+    selected = [arg for arg in args_with_func if getattr(args, arg)]
+    if not selected and (args.patterns or args.classes or args.modules):
+        selected = ["unit"]
+    elif not selected:
+        selected = ["unit", "code"]
+
+    if args.startup_report:
+        from simc_test.startup import startup_report
+
+        mode_modules = {"entry point": "simc_test.test_suite"}
+        for arg in selected:
+            mode_modules[arg] = MODE_MODULES[arg]
+        startup_report(mode_modules)
+        return
+
+    # The tests affected by the changes of simc are worked out once for all kinds of test
+    args.impact = None
+    if args.changed_since is not None or args.changed:
+        from simc_test.impact import get_impact
+
+        args.impact = get_impact(args.changed_since)
+        if args.impact is None:
+            sys.exit(1)
+
+    # Durations of earlier runs balance the shards and the ones of this run are added to
+    # them, outcomes are collected for --results and reported as they come in
+    args.duration_history = None
+    args.run_results = None
+    if "unit" in selected or "code" in selected:
+        from simc_test.history import DurationHistory
+        from simc_test.reporters import get_reporters
+        from simc_test.results import Results
+
+        args.duration_history = DurationHistory(args.history)
+        args.run_results = Results(get_reporters(args.ndjson, args.junit_xml))
+
+    # Checks report failure by returning False, which sets the exit status
+    failed = False
+    for arg in selected:
+        print("*" * 50)
+        print(f"Running {arg} test")
+        print("*" * 50)
+        if args_with_func[arg](args) is False:
+            failed = True
+
+    # Shards leave the history alone, every node has to balance with the same durations.
+    # merge-results --update-history adds the durations of all shards instead
+    if args.run_results is not None:
+        if args.shard is None:
+            args.duration_history.add_results(args.run_results)
+            args.duration_history.save()
+
+        if args.results is not None:
+            args.run_results.write(args.results)
+
+        for reporter in args.run_results.reporters:
+            reporter.close()
 
-    def hello():
-        print("Hello World")
-
-    args = vars(parser.parse_args())
-    args_with_func = {"unit": unit_test, "code": run_simc_codes}
-
-    if not any(list(args.values())):
-        for arg, test_func in args_with_func.items():
-            print("*" * 50)
-            print(f"Running {arg} test")
-            print("*" * 50)
-            test_func()
-    else:
-        for arg, should_run in args.items():
-            if should_run:
-                print("*" * 50)
-                print(f"Running {arg} test")
-                print("*" * 50)
-                args_with_func[arg]()
+    if failed:
+        sys.exit(1)
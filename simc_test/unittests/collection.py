@@ -0,0 +1,110 @@
+import ast
+import fnmatch
+import importlib
+import importlib.util
+import unittest
+
+# Test classes to run as (module, class name), the modules are only imported when one of
+# their tests is selected
+TEST_CLASSES = [
+    ("simc_test.unittests.test_global_helpers", "TestGlobalHelpers"),
+    ("simc_test.unittests.test_lexical_analyzer", "TestLexicalAnalyzer"),
+    ("simc_test.unittests.test_op_code", "TestOpCode"),
+    ("simc_test.unittests.test_symbol_table", "TestSymbolTable"),
+    ("simc_test.unittests.test_token_class", "TestTokenClass"),
+    ("simc_test.unittests.test_simc", "TestSimc"),
+    ("simc_test.unittests.test_compiler", "TestCompiler"),
+    ("simc_test.unittests.parser.test_array_parser", "TestArrayParser"),
+    ("simc_test.unittests.parser.test_conditional_parser", "TestConditionalParser"),
+    ("simc_test.unittests.parser.test_function_parser", "TestFunctionParser"),
+    ("simc_test.unittests.parser.test_loop_parser", "TestLoopParser"),
+    ("simc_test.unittests.parser.test_struct_parser", "TestStructParser"),
+    ("simc_test.unittests.parser.test_variable_parser", "TestVariableParser"),
+    ("simc_test.unittests.parser.test_simc_parser", "TestSimcParser"),
+]
+
+
+def is_registered_test_id(test_id):
+    # module.Class.test_method of a registered class, any other name could import anything
+    module_and_class, _, method = test_id.rpartition(".")
+    module, _, class_name = module_and_class.rpartition(".")
+    return (
+        (module, class_name) in TEST_CLASSES
+        and method.isidentifier()
+        and method.startswith("test")
+    )
+
+
+def to_glob(pattern):
+    # Same rule as unittest's -k, a pattern without wildcards matches as a substring
+    if "*" not in pattern:
+        return f"*{pattern}*"
+    return pattern
+
+
+def matches_any(name, patterns):
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def scan_test_methods(module, class_name, prefix="test"):
+    # Test method names of a class read from the source of its module with ast, so that
+    # modules without a selected test are never imported
+    with open(importlib.util.find_spec(module).origin) as file:
+        tree = ast.parse(file.read())
+
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == class_name:
+            # A method defined twice only runs once, as its last definition
+            names = [
+                item.name
+                for item in node.body
+                if isinstance(item, ast.FunctionDef) and item.name.startswith(prefix)
+            ]
+            return list(dict.fromkeys(names))
+
+    return []
+
+
+def list_test_ids(patterns=None, classes=None, modules=None):
+    # Ids of the registered tests matching the --module, --class and -k patterns, -k is
+    # matched against the full test id like unittest does. Nothing is imported
+    module_globs = [to_glob(pattern) for pattern in modules or []]
+    class_globs = [to_glob(pattern) for pattern in classes or []]
+    test_id_globs = [to_glob(pattern) for pattern in patterns or []]
+
+    test_ids = []
+    for module, class_name in TEST_CLASSES:
+        if module_globs and not matches_any(module, module_globs):
+            continue
+        if class_globs and not matches_any(class_name, class_globs):
+            continue
+
+        for method in scan_test_methods(module, class_name):
+            test_id = f"{module}.{class_name}.{method}"
+            if not test_id_globs or matches_any(test_id, test_id_globs):
+                test_ids.append(test_id)
+
+    return test_ids
+
+
+def load_tests(patterns=None, classes=None, modules=None, test_ids=None):
+    # Extra test ids restrict the selection further, e.g. to the tests affected by a change
+    selected_ids = set(list_test_ids(patterns, classes, modules))
+    if test_ids is not None:
+        selected_ids &= set(test_ids)
+
+    # Load the selected test cases into suites_list, only their modules are imported
+    loader = unittest.TestLoader()
+    suites_list = []
+    for module, class_name in TEST_CLASSES:
+        prefix = f"{module}.{class_name}."
+        if not any(test_id.startswith(prefix) for test_id in selected_ids):
+            continue
+
+        test_class = getattr(importlib.import_module(module), class_name)
+        suite = loader.loadTestsFromTestCase(test_class)
+        suites_list.append(
+            unittest.TestSuite(test for test in suite if test.id() in selected_ids)
+        )
+
+    return unittest.TestSuite(suites_list)
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import unittest
+
+from simc_test.helpers import make_scratch_dir, remove_dir
+
+
+class SimcTestCase(unittest.TestCase):
+    """
+    Test case with a scratch directory of its own, tests write their files there instead of
+    the current directory so that they can run concurrently
+    """
+
+    __scratch_dir = None
+
+    @property
+    def scratch_dir(self):
+        # Created on first use, most tests never touch the file system
+        if self.__scratch_dir is None:
+            self.__scratch_dir = make_scratch_dir()
+            self.addCleanup(self.__remove_scratch_dir)
+
+        return self.__scratch_dir
+
+    def __remove_scratch_dir(self):
+        remove_dir(self.__scratch_dir)
+        self.__scratch_dir = None
+
+    def scratch_path(self, filename):
+        return os.path.join(self.scratch_dir, filename)
+
+    def getoutput(self, cmd):
+        # subprocess.getoutput run from the scratch directory
+        process = subprocess.run(
+            cmd,
+            shell=True,
+            cwd=self.scratch_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+
+        output = process.stdout
+        if output[-1:] == "\n":
+            output = output[:-1]
+
+        return output
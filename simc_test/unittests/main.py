@@ -1,62 +1,179 @@
+import time
 import unittest
-import os
-import subprocess
-
-from .test_global_helpers import TestGlobalHelpers
-from .test_lexical_analyzer import TestLexicalAnalyzer
-from .test_op_code import TestOpCode
-from .test_symbol_table import TestSymbolTable
-from .test_token_class import TestTokenClass
-from .test_simc import TestSimc
-from .test_compiler import TestCompiler
-from .parser.test_array_parser import TestArrayParser
-from .parser.test_conditional_parser import TestConditionalParser
-from .parser.test_function_parser import TestFunctionParser
-from .parser.test_loop_parser import TestLoopParser
-from .parser.test_struct_parser import TestStructParser
-from .parser.test_variable_parser import TestVariableParser
-from .parser.test_simc_parser import TestSimcParser
-
-from simc_test.helpers import make_dir, remove_dir
-
-
-def unit_test():
-    test_dir_path = ".simc-test-suite"
-    make_dir(test_dir_path)
-    os.chdir(test_dir_path)
-
-    # List of test classes to run
-    test_classes_to_run = [
-        TestGlobalHelpers,
-        TestLexicalAnalyzer,
-        TestOpCode,
-        TestSymbolTable,
-        TestTokenClass,
-        TestSimc,
-        TestCompiler,
-        TestArrayParser,
-        TestConditionalParser,
-        TestFunctionParser,
-        TestLoopParser,
-        TestStructParser,
-        TestVariableParser,
-        TestSimcParser,
-    ]
-
-    loader = unittest.TestLoader()
-
-    # Load all test cases into suites_list
-    suites_list = []
-    for test_class in test_classes_to_run:
-        suite = loader.loadTestsFromTestCase(test_class)
-        suites_list.append(suite)
-
-    # Collection of all the suites
-    big_suite = unittest.TestSuite(suites_list)
-
-    # Run the tests
-    runner = unittest.TextTestRunner()
-    results = runner.run(big_suite)
-
-    os.chdir("../")
-    remove_dir(test_dir_path)
+
+from simc_test.helpers import default_jobs, run_in_pool
+from simc_test.sharding import shard_items
+from simc_test.unittests.collection import list_test_ids, load_tests
+
+
+class RemoteTest:
+    """
+    Stand-in for a test which ran in a worker process, used to report its outcome
+    """
+
+    def __init__(self, test_id, description):
+        self.test_id = test_id
+        self.description = description
+
+    def id(self):
+        return self.test_id
+
+    def shortDescription(self):
+        return None
+
+    def __str__(self):
+        return self.description
+
+
+class RemoteTestResult(unittest.TextTestResult):
+    # Errors of remote tests arrive already formatted as strings
+    def _exc_info_to_string(self, err, test):
+        if isinstance(err, str):
+            return err
+        return super()._exc_info_to_string(err, test)
+
+
+def run_unit_test(test_id):
+    started = time.perf_counter()
+    suite = unittest.defaultTestLoader.loadTestsFromName(test_id)
+    result = unittest.TestResult()
+    suite.run(result)
+    duration = time.perf_counter() - started
+
+    outcomes = {
+        "error": result.errors,
+        "failure": result.failures,
+        "skip": result.skipped,
+        "expected_failure": result.expectedFailures,
+        "unexpected_success": [(test, "") for test in result.unexpectedSuccesses],
+    }
+
+    # A single test can report several outcomes when it uses subtests
+    reports = []
+    for outcome, tests in outcomes.items():
+        for test, details in tests:
+            reports.append((outcome, test.id(), str(test), details))
+    if not reports:
+        reports.append(("success", test_id, str(list(suite)[0]), ""))
+
+    return reports, duration
+
+
+def replay_reports(result, reports):
+    test = RemoteTest(reports[0][1], reports[0][2])
+    result.startTest(test)
+
+    for outcome, test_id, description, details in reports:
+        reported_test = RemoteTest(test_id, description)
+        if outcome == "success":
+            result.addSuccess(reported_test)
+        elif outcome == "error":
+            result.addError(reported_test, details)
+        elif outcome == "failure":
+            result.addFailure(reported_test, details)
+        elif outcome == "skip":
+            result.addSkip(reported_test, details)
+        elif outcome == "expected_failure":
+            result.addExpectedFailure(reported_test, details)
+        elif outcome == "unexpected_success":
+            result.addUnexpectedSuccess(reported_test)
+
+    result.stopTest(test)
+
+
+class ParallelTestSuite:
+    """
+    Runs test ids in worker processes (in this process with a single job) and replays
+    their outcomes on the runner's result
+    """
+
+    def __init__(self, test_ids, jobs, results=None):
+        self.test_ids = test_ids
+        self.jobs = jobs
+        self.results = results
+
+    def countTestCases(self):
+        return len(self.test_ids)
+
+    def __call__(self, result):
+        for reports, duration in run_in_pool(run_unit_test, self.test_ids, self.jobs):
+            replay_reports(result, reports)
+            if self.results is not None:
+                self.results.add_unit(reports, duration)
+
+        return result
+
+
+class ReplayedTestSuite:
+    """
+    Replays the outcomes of tests which ran elsewhere, e.g. on the shards of a CI run
+    """
+
+    def __init__(self, all_reports):
+        self.all_reports = all_reports
+
+    def countTestCases(self):
+        return len(self.all_reports)
+
+    def __call__(self, result):
+        for reports in self.all_reports:
+            replay_reports(result, reports)
+
+        return result
+
+
+def get_test_ids(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from get_test_ids(test)
+        else:
+            yield test.id()
+
+
+def unit_test(
+    jobs=None,
+    patterns=None,
+    classes=None,
+    modules=None,
+    impact=None,
+    shard=None,
+    history=None,
+    results=None,
+):
+    if jobs is None:
+        jobs = default_jobs()
+
+    # Narrow the selection down to the tests affected by the changes of simc
+    test_ids = list_test_ids(patterns, classes, modules)
+    if impact is not None:
+        test_ids = impact.select_test_ids(test_ids)
+        if not test_ids:
+            print("\033[92mNo unit tests are affected by the changes!\033[m")
+            return
+
+    # Only this node's part of the tests, balanced with the durations of a --history file
+    if shard is not None:
+        durations = None
+        if history is not None and history.shared:
+            durations = history.get("unit")
+        test_ids = shard_items(test_ids, shard, durations)
+        if not test_ids:
+            print("\033[92mNo unit tests in this shard!\033[m")
+            return
+
+    # Only the modules of the selected tests are imported
+    test_ids = list(get_test_ids(load_tests(patterns, classes, modules, test_ids)))
+    if not test_ids:
+        print("\033[91mNo unit tests match the selection!\033[m")
+        return False
+
+    # Recent failures and the longest tests start first
+    if history is not None:
+        test_ids = history.schedule("unit", test_ids)
+
+    # The tests are spread across worker processes and merged back into one report, every
+    # test writes its files into a scratch directory of its own
+    runner = unittest.TextTestRunner(resultclass=RemoteTestResult)
+    result = runner.run(ParallelTestSuite(test_ids, jobs, results))
+
+    return result.wasSuccessful()
@@ -6,7 +6,8 @@ from simc.parser.function_parser import *
 from simc.parser.simc_parser import parse
 from simc.token_class import Token
 from simc.symbol_table import SymbolTable
-from simc.lexical_analyzer import LexicalAnalyzer
+
+from simc_test.pipeline import SourceLexicalAnalyzer
 
 
 class TestFunctionParser(unittest.TestCase):
@@ -24,12 +25,8 @@ class TestFunctionParser(unittest.TestCase):
         sys.stdout = sys.__stdout__
 
     def __return_tokens_and_table(self, source_code):
-        filename = "function-parse-test.simc"
-        with open(filename, "w") as file:
-            file.write(source_code)
-
         table = SymbolTable()
-        lexer = LexicalAnalyzer(filename, table)
+        lexer = SourceLexicalAnalyzer(source_code, table)
         tokens, _ = lexer.lexical_analyze()
 
         return tokens, table
@@ -6,7 +6,8 @@ import subprocess
 from simc.parser.simc_parser import *
 from simc.token_class import Token
 from simc.symbol_table import SymbolTable
-from simc.lexical_analyzer import LexicalAnalyzer
+
+from simc_test.pipeline import SourceLexicalAnalyzer
 
 
 class TestSimcParser(unittest.TestCase):
@@ -23,15 +24,9 @@ class TestSimcParser(unittest.TestCase):
         # Release print
         sys.stdout = sys.__stdout__
 
-    def __write_to_file(self, source_code):
-        with open("simc-parser-test.simc", "w") as file:
-            file.write(source_code)
-
     def __get_opcodes(self, source_code):
-        self.__write_to_file(source_code)
-
         table = SymbolTable()
-        lexer = LexicalAnalyzer("simc-parser-test.simc", table)
+        lexer = SourceLexicalAnalyzer(source_code, table)
         tokens, _ = lexer.lexical_analyze()
 
         opcodes = parse(tokens, table)
@@ -5,9 +5,10 @@ import subprocess
 
 from simc.compiler import *
 from simc.symbol_table import SymbolTable
-from simc.lexical_analyzer import LexicalAnalyzer
 from simc.parser.simc_parser import parse
 
+from simc_test.pipeline import SourceLexicalAnalyzer, compile_to_string
+
 
 class TestCompiler(unittest.TestCase):
 
@@ -24,20 +25,14 @@ class TestCompiler(unittest.TestCase):
         sys.stdout = sys.__stdout__
 
     def __compile(self, source_code):
-        with open("simc-compiler-test.simc", "w") as file:
-            file.write(source_code)
-
         table = SymbolTable()
 
-        lexer = LexicalAnalyzer("simc-compiler-test.simc", table)
+        lexer = SourceLexicalAnalyzer(source_code, table)
         tokens, _ = lexer.lexical_analyze()
 
         opcodes = parse(tokens, table)
 
-        compile(opcodes, "simc-compiler-test.c", table)
-
-        with open("simc-compiler-test.c", "r") as file:
-            return file.read()
+        return compile_to_string(opcodes, table)
 
     ####################################################################################################
     # TESTS
@@ -1,5 +1,3 @@
-import unittest
-import os
 import io
 import sys
 
@@ -7,10 +5,13 @@ from simc.lexical_analyzer import LexicalAnalyzer
 from simc.symbol_table import SymbolTable
 from simc.token_class import Token
 
+from simc_test.pipeline import SourceLexicalAnalyzer
+
 from .exceptions import NotATokenError
+from .fixtures import SimcTestCase
 
 
-class TestLexicalAnalyzer(unittest.TestCase):
+class TestLexicalAnalyzer(SimcTestCase):
 
     ####################################################################################################
     # HELPERS
@@ -46,15 +47,20 @@ class TestLexicalAnalyzer(unittest.TestCase):
 
         self.__assertListEquality(tokens, [Token(token_type, "", 1)])
 
-    def __setup(self, source_code):
-        self.source_filename = "lexical-analysis-test.simc"
-
-        self.__write_to_file(self.source_filename, source_code)
-
+    def __setup(self, source_code, from_file=False):
         self.symbol_table = SymbolTable()
-        self.lexical_analyzer = LexicalAnalyzer(
-            source_filename=self.source_filename, symbol_table=self.symbol_table
-        )
+
+        # Source code is read from memory unless reading the file is what is being tested
+        if from_file:
+            self.source_filename = self.scratch_path("lexical-analysis-test.simc")
+            self.__write_to_file(self.source_filename, source_code)
+            self.lexical_analyzer = LexicalAnalyzer(
+                source_filename=self.source_filename, symbol_table=self.symbol_table
+            )
+        else:
+            self.lexical_analyzer = SourceLexicalAnalyzer(
+                source_code=source_code, symbol_table=self.symbol_table
+            )
 
         # Set initial index
         self.lexical_analyzer.current_source_index = 0
@@ -69,7 +75,7 @@ class TestLexicalAnalyzer(unittest.TestCase):
         print("Hello World")
         """
 
-        self.__setup(source_code=test_source_code)
+        self.__setup(source_code=test_source_code, from_file=True)
 
         source_code = self.lexical_analyzer._LexicalAnalyzer__read_source_code()
         self.assertEqual(source_code, test_source_code + "\0")
@@ -78,7 +84,7 @@ class TestLexicalAnalyzer(unittest.TestCase):
         # Test with empty source code
         empty_source_code = ""
 
-        self.__setup(source_code=empty_source_code)
+        self.__setup(source_code=empty_source_code, from_file=True)
 
         self.__write_to_file(self.source_filename, empty_source_code)
 
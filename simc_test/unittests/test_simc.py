@@ -1,15 +1,15 @@
-import unittest
 import os
-import subprocess
 
+from .fixtures import SimcTestCase
 
-class TestSimc(unittest.TestCase):
+
+class TestSimc(SimcTestCase):
 
     ####################################################################################################
     # HELPERS
     ####################################################################################################
     def __write_to_file(self, filename, string):
-        with open(filename, "w") as file:
+        with open(self.scratch_path(filename), "w") as file:
             file.write(string)
 
     def __assertListEquality(self, sources, matches):
@@ -24,7 +24,7 @@ class TestSimc(unittest.TestCase):
 
         self.__write_to_file("test-simc.simc", source_code)
 
-        output = subprocess.getoutput("simc test-simc.simc token").split("\n")
+        output = self.getoutput("simc test-simc.simc token").split("\n")
 
         compare_list = [
             "Token(print, , 1)",
@@ -41,7 +41,7 @@ class TestSimc(unittest.TestCase):
 
         self.__write_to_file("test-simc.simc", source_code)
 
-        output = subprocess.getoutput("simc test-simc.simc opcode").split("\n")
+        output = self.getoutput("simc test-simc.simc opcode").split("\n")
 
         compare_list = [
             "OpCode('print', '\"Hello World\"', 'None')",
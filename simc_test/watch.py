@@ -0,0 +1,319 @@
+import ctypes
+import ctypes.util
+import glob
+import importlib
+import json
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+
+# Files whose changes trigger a run, editors also write swap and backup files
+WATCHED_SUFFIXES = (".py", ".simc")
+
+# Modules which survive a reload, everything else of simc_test may hold on to simc
+KEPT_MODULES = {
+    "simc_test",
+    "simc_test.helpers",
+    "simc_test.startup",
+    "simc_test.test_suite",
+    "simc_test.watch",
+}
+
+
+class Inotify:
+    """
+    Minimal inotify binding with ctypes, watches directories recursively and reports the
+    paths of files which were written, created, moved or deleted
+    """
+
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_ISDIR = 0x40000000
+    EVENT_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    # struct inotify_event: int wd, uint32 mask, uint32 cookie, uint32 len, char name[]
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, dirs):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.watched_dirs = {}
+        for dir_path in dirs:
+            for sub_dir_path, _, _ in os.walk(dir_path):
+                self.add_watch(sub_dir_path)
+
+    def add_watch(self, dir_path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), self.EVENT_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {dir_path}")
+        self.watched_dirs[wd] = dir_path
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if wd not in self.watched_dirs:
+                continue
+            path = os.path.join(self.watched_dirs[wd], name)
+
+            # Directories created later on are watched as well
+            if mask & self.IN_ISDIR and mask & self.IN_CREATE:
+                self.add_watch(path)
+            elif not mask & self.IN_ISDIR:
+                changed.add(path)
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Poller:
+    """
+    Fallback for systems without inotify, compares the modification times of the watched
+    files every interval
+    """
+
+    def __init__(self, dirs, interval=0.25):
+        self.dirs = dirs
+        self.interval = interval
+        self.mtimes = self.snapshot()
+
+    def snapshot(self):
+        mtimes = {}
+        for dir_path in self.dirs:
+            for file_path in glob.glob(os.path.join(dir_path, "**", "*"), recursive=True):
+                if file_path.endswith(WATCHED_SUFFIXES):
+                    try:
+                        mtimes[file_path] = os.stat(file_path).st_mtime_ns
+                    except OSError:
+                        pass
+
+        return mtimes
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+
+        mtimes = self.snapshot()
+        changed = {
+            file_path
+            for file_path in set(mtimes) | set(self.mtimes)
+            if mtimes.get(file_path) != self.mtimes.get(file_path)
+        }
+        self.mtimes = mtimes
+
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(dirs):
+    try:
+        return Inotify(dirs)
+    except (OSError, AttributeError):
+        # AttributeError when libc has no inotify functions at all, e.g. on macOS
+        return Poller(dirs)
+
+
+def wait_for_changes(watcher, settle_time=0.1):
+    # Block until a watched file changes, then keep collecting until the editor is done
+    # saving so that one save triggers one run
+    changed = set()
+    while not changed:
+        changed = {path for path in watcher.wait(1) if path.endswith(WATCHED_SUFFIXES)}
+
+    while True:
+        more = watcher.wait(settle_time)
+        more = {path for path in more if path.endswith(WATCHED_SUFFIXES)}
+        if not more:
+            return changed
+        changed |= more
+
+
+def purge_modules():
+    # Drop simc and every module of the test suite that imported from it, the next run
+    # imports them again from the changed sources
+    for name in list(sys.modules):
+        if name == "simc" or name.startswith("simc."):
+            del sys.modules[name]
+        elif name.startswith("simc_test.") and name not in KEPT_MODULES:
+            del sys.modules[name]
+
+    importlib.invalidate_caches()
+
+
+class WatchSelection:
+    """
+    Tests to run after a change, the simc functions that changed select unit tests and
+    corpus files through the impact map (or everything without one) and changed corpus
+    files are run themselves
+    """
+
+    def __init__(self, impact, simc_changed, corpus_files):
+        self.impact = impact
+        self.simc_changed = simc_changed
+        self.corpus_files = corpus_files
+
+    def select_test_ids(self, test_ids):
+        if not self.simc_changed:
+            return []
+        if self.impact is None:
+            return test_ids
+        return self.impact.select_test_ids(test_ids)
+
+    def select_corpus_files(self, files):
+        selected = set(self.corpus_files)
+        if self.simc_changed:
+            if self.impact is None:
+                selected.update(files)
+            else:
+                selected.update(self.impact.select_corpus_files(files))
+
+        return [file for file in files if file in selected]
+
+
+def index_simc_modules(simc_dir):
+    from simc_test.impact import index_source, list_simc_modules, read_source
+
+    index = {}
+    for module in list_simc_modules(simc_dir):
+        index[module], _ = index_source(read_source(os.path.join(simc_dir, module)))
+
+    return index
+
+
+def load_impact_map(simc_dir):
+    from simc_test.impact import get_impact_map_path
+
+    impact_map_path = get_impact_map_path(simc_dir)
+    if not os.path.exists(impact_map_path):
+        return None
+
+    with open(impact_map_path) as file:
+        return json.load(file)
+
+
+def run_changes(changed_paths, simc_dir, corpus_dir, simc_index, impact_map, **options):
+    purge_modules()
+
+    from simc_test.impact import Impact, changed_functions, index_source, read_source
+    from simc_test.unittests.main import unit_test
+    from simc_test.codetests.main import run_simc_codes
+
+    # Functions changed since the previous run, compared with the index kept in memory
+    changed = set()
+    corpus_files = []
+    for path in sorted(changed_paths):
+        if path.startswith(os.path.join(simc_dir, "")) and path.endswith(".py"):
+            module = os.path.relpath(path, simc_dir).replace(os.sep, "/")
+            hashes = {}
+            if os.path.exists(path):
+                hashes, _ = index_source(read_source(path))
+            changed |= changed_functions(simc_index.get(module, {}), hashes, module)
+            simc_index[module] = hashes
+        elif path.endswith(".simc") and os.path.exists(path):
+            corpus_files.append(path)
+
+    if not changed and not corpus_files:
+        return
+
+    print(
+        f"\033[1;37;0m{len(changed)} changed simc functions, "
+        f"{len(corpus_files)} changed sim-C files\033[m"
+    )
+    for function in sorted(changed):
+        print(f"    {function}")
+
+    impact = Impact(impact_map, changed) if impact_map is not None else None
+    selection = WatchSelection(impact, bool(changed), corpus_files)
+
+    # Everything runs in this process, which already paid for interpreter startup
+    started = time.perf_counter()
+    if changed:
+        unit_test(
+            jobs=1,
+            patterns=options["patterns"],
+            classes=options["classes"],
+            modules=options["modules"],
+            impact=selection,
+        )
+    run_simc_codes(jobs=1, corpus=corpus_dir, impact=selection)
+    print(f"\033[1;37;0mFinished in {time.perf_counter() - started:.2f}s\033[m")
+
+
+def watch(patterns=None, classes=None, modules=None, corpus=None, refresh_corpus=False):
+    from simc_test.codetests.cache import get_simc_dir
+    from simc_test.codetests.corpus import CorpusError, get_corpus
+
+    simc_dir = os.path.realpath(get_simc_dir())
+    try:
+        corpus_dir = os.path.realpath(get_corpus(corpus, refresh=refresh_corpus))
+    except CorpusError as e:
+        print(f"\033[91mCould not get the sim-C codes: {e}\033[m")
+        return False
+
+    # Without an impact map every unit test and corpus file runs when simc changes
+    impact_map = load_impact_map(get_simc_dir())
+    if impact_map is None:
+        print(
+            "\033[93mNo impact map, every test runs when simc changes "
+            "(record one with --record-impact)\033[m"
+        )
+
+    simc_index = index_simc_modules(simc_dir)
+
+    # Import simc and the test modules up front so that the first run is warm as well
+    from simc_test.unittests.collection import load_tests
+
+    load_tests(patterns, classes, modules)
+    importlib.import_module("simc_test.codetests.main")
+
+    watcher = make_watcher([simc_dir, corpus_dir])
+    print(
+        f"\033[1;37;0mWatching {simc_dir} and {corpus_dir} for changes "
+        f"({type(watcher).__name__}), press Ctrl+C to stop\033[m"
+    )
+
+    try:
+        while True:
+            changed_paths = wait_for_changes(watcher)
+            # A half edited file, e.g. one which does not parse yet, fails a single run
+            # and the next save runs again
+            try:
+                run_changes(
+                    changed_paths,
+                    simc_dir,
+                    corpus_dir,
+                    simc_index,
+                    impact_map,
+                    patterns=patterns,
+                    classes=classes,
+                    modules=modules,
+                )
+            except Exception:
+                traceback.print_exc()
+                print("\033[91mThe run failed, watching for the next change\033[m")
+    except KeyboardInterrupt:
+        print("\033[m")
+    finally:
+        watcher.close()
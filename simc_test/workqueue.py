@@ -0,0 +1,460 @@
+import collections
+import functools
+import json
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from simc_test.helpers import default_jobs, make_scratch_dir, remove_dir
+from simc_test.history import DurationHistory
+from simc_test.results import Results, code_test_passed, unit_test_passed
+
+# A silent TCP peer is probed after this many seconds, then every interval, and counts as
+# gone once this many probes went unanswered
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+
+def parse_address(address):
+    # host:port for TCP, a path (or unix:path) for a Unix socket
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:") :]
+    if "/" in address:
+        return socket.AF_UNIX, address
+
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def enable_keepalive(sock):
+    # A machine which lost power or its network never closes its connections, keepalive
+    # probes find out that it is gone. Unix sockets close with their process
+    if sock.family != socket.AF_INET:
+        return
+
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in [
+        ("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+        ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+        ("TCP_KEEPCNT", KEEPALIVE_COUNT),
+    ]:
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+def encode_message(message):
+    # Messages are JSON objects, one per line
+    return json.dumps(message).encode() + b"\n"
+
+
+def item_key(item):
+    return f"{item['kind']}:{item['name']}"
+
+
+def get_queue_items(
+    unit=True,
+    code=True,
+    patterns=None,
+    classes=None,
+    modules=None,
+    corpus=None,
+    refresh_corpus=False,
+    timeout=None,
+    trace_memory=False,
+):
+    # Unit tests travel as test ids, corpus files with their source and compile options so
+    # that workers need neither the corpus, the same paths nor the same options
+    from simc_test.unittests.collection import list_test_ids
+    from simc_test.codetests.corpus import get_corpus, list_corpus
+
+    items = []
+    if unit:
+        for test_id in list_test_ids(patterns, classes, modules):
+            items.append({"kind": "unit", "name": test_id})
+
+    if code:
+        for file in list_corpus(get_corpus(corpus, refresh=refresh_corpus)):
+            with open(file) as source_file:
+                source_code = source_file.read()
+            name = os.path.basename(file)
+            items.append(
+                {
+                    "kind": "code",
+                    "name": name,
+                    "source": source_code,
+                    "timeout": timeout,
+                    "trace_memory": trace_memory,
+                }
+            )
+
+    return items
+
+
+class WorkerConnection:
+    """
+    Coordinator side of a worker connection, with the items leased to that worker and
+    when their leases run out
+    """
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        # Workers on a Unix socket have no address of their own
+        self.address = "%s:%d" % address if address else "local"
+        self.buffer = b""
+        self.leases = {}
+
+    def send(self, message):
+        self.sock.sendall(encode_message(message))
+
+    def receive(self):
+        # Complete messages received so far, None once the worker has gone away
+        try:
+            data = self.sock.recv(64 * 1024)
+        except OSError:
+            data = b""
+        if not data:
+            return None
+
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+        return [json.loads(line) for line in lines if line]
+
+
+class Coordinator:
+    """
+    Hands out items to the workers asking for them and collects their results. Requests
+    that arrive while every remaining item is leased wait until an item is re-queued or
+    the run is over, items of workers that disconnect or whose lease ran out go back to
+    the front of the queue
+    """
+
+    def __init__(self, items, reporters=(), lease_timeout=None):
+        self.items = {item_key(item): item for item in items}
+        self.lease_timeout = lease_timeout
+        self.pending = collections.deque(self.items)
+        self.waiting = collections.deque()
+        self.results = Results(reporters)
+        self.finished = set()
+
+    def is_done(self):
+        return len(self.finished) == len(self.items)
+
+    def hand_out(self, connection):
+        # Items re-queued after their lease ran out may have been finished by their first
+        # worker since
+        while self.pending and self.pending[0] in self.finished:
+            self.pending.popleft()
+
+        if self.pending:
+            key = self.pending.popleft()
+            deadline = None
+            if self.lease_timeout is not None:
+                deadline = time.monotonic() + self.lease_timeout
+            connection.leases[key] = deadline
+            connection.send({"type": "item", "item": self.items[key]})
+        elif self.is_done():
+            connection.send({"type": "done"})
+        else:
+            self.waiting.append(connection)
+
+    def finish(self, connection, message):
+        key = message["key"]
+        connection.leases.pop(key, None)
+        if key in self.finished or key not in self.items:
+            return
+
+        self.finished.add(key)
+        name = self.items[key]["name"]
+        if self.items[key]["kind"] == "unit":
+            self.results.add_unit(message["reports"], message["duration"])
+        else:
+            self.results.add_code(name, message["result"], message["duration"])
+
+        status = "\033[92mok" if message["passed"] else "\033[91mfailed"
+        progress = f"[{len(self.finished)}/{len(self.items)}]"
+        print(f"{progress} {name} {status}\033[m ({connection.address})")
+
+    def drop(self, connection):
+        # Items leased to a worker which went away are put back in front of the queue
+        connection.sock.close()
+        self.waiting = collections.deque(
+            waiting for waiting in self.waiting if waiting is not connection
+        )
+
+        if connection.leases:
+            print(
+                f"\033[93mRe-queueing {len(connection.leases)} items of "
+                f"{connection.address}\033[m"
+            )
+        for key in connection.leases:
+            if key not in self.finished:
+                self.pending.appendleft(key)
+        connection.leases.clear()
+
+    def expire_leases(self, connections):
+        # A worker may be stuck, or gone without its connection being closed yet. A result
+        # it sends after all still counts if it is the first one
+        now = time.monotonic()
+        for connection in connections:
+            expired = [
+                key
+                for key, deadline in connection.leases.items()
+                if deadline is not None and deadline <= now
+            ]
+            if not expired:
+                continue
+
+            print(
+                f"\033[93mRe-queueing {len(expired)} items of {connection.address}, "
+                f"their lease ran out\033[m"
+            )
+            for key in expired:
+                del connection.leases[key]
+                if key not in self.finished:
+                    self.pending.appendleft(key)
+
+    def get_select_timeout(self, connections):
+        # Seconds until the next lease runs out, None without leases that do
+        deadlines = [
+            deadline
+            for connection in connections
+            for deadline in connection.leases.values()
+            if deadline is not None
+        ]
+        if not deadlines:
+            return None
+        return max(min(deadlines) - time.monotonic(), 0)
+
+    def serve_waiting(self):
+        while self.waiting and (self.pending or self.is_done()):
+            connection = self.waiting.popleft()
+            try:
+                self.hand_out(connection)
+            except OSError:
+                pass
+
+    def serve(self, address):
+        family, sockaddr = parse_address(address)
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX and os.path.exists(sockaddr):
+            os.remove(sockaddr)
+        else:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(sockaddr)
+        server.listen()
+
+        if family == socket.AF_INET:
+            sockaddr = "%s:%d" % server.getsockname()
+        print(f"\033[1;37;0mServing {len(self.items)} items on {sockaddr}\033[m")
+        sys.stdout.flush()
+
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ)
+        connections = []
+        try:
+            while not self.is_done():
+                for key, _ in selector.select(self.get_select_timeout(connections)):
+                    if key.fileobj is server:
+                        sock, peer = server.accept()
+                        enable_keepalive(sock)
+                        connection = WorkerConnection(sock, peer)
+                        connections.append(connection)
+                        selector.register(sock, selectors.EVENT_READ, connection)
+                        continue
+
+                    connection = key.data
+                    messages = connection.receive()
+                    if messages is None:
+                        selector.unregister(connection.sock)
+                        connections.remove(connection)
+                        self.drop(connection)
+                        continue
+
+                    for message in messages:
+                        if message["type"] == "result":
+                            self.finish(connection, message)
+                        elif message["type"] == "request":
+                            self.waiting.append(connection)
+
+                self.expire_leases(connections)
+                self.serve_waiting()
+        finally:
+            # Workers still asking for work are told the run is over
+            self.serve_waiting()
+            for connection in connections:
+                connection.sock.close()
+            server.close()
+            if family == socket.AF_UNIX:
+                os.remove(sockaddr)
+
+        return self.results
+
+
+def serve_queue(
+    address,
+    results_path=None,
+    history_path=None,
+    reporters=(),
+    lease_timeout=None,
+    **selection,
+):
+    from simc_test.unittests.main import RemoteTestResult, ReplayedTestSuite
+    from simc_test.codetests.main import print_code_summary
+    from simc_test.codetests.corpus import CorpusError
+
+    try:
+        items = get_queue_items(**selection)
+    except CorpusError as e:
+        print(f"\033[91mCould not get the sim-C codes: {e}\033[m")
+        return False
+    if not items:
+        print("\033[91mNo unit tests or code tests to hand out!\033[m")
+        return False
+
+    # Recent failures and the longest items are handed out first
+    history = DurationHistory(history_path)
+    items = sorted(items, key=lambda item: history.priority(item["kind"], item["name"]))
+
+    results = Coordinator(items, reporters, lease_timeout).serve(address)
+
+    passed = True
+    if results.unit:
+        print("*" * 50)
+        print("Unit test")
+        print("*" * 50)
+        runner = unittest.TextTestRunner(resultclass=RemoteTestResult)
+        all_reports = sorted(results.unit, key=lambda reports: reports[0][1])
+        result = runner.run(ReplayedTestSuite(all_reports))
+        passed = result.wasSuccessful()
+
+    if results.code:
+        print("*" * 50)
+        print("Code test")
+        print("*" * 50)
+        if not print_code_summary(sorted(results.code.items())):
+            passed = False
+
+    history.add_results(results)
+    history.save()
+
+    if results_path is not None:
+        results.write(results_path)
+
+    return passed
+
+
+def run_item(item, backend):
+    # Runs on a worker, returns the result message for the coordinator. Only registered
+    # unit tests are loaded, a test id names a module to import. Code tests are written
+    # into the scratch directory by their filename only
+    from simc_test.unittests.collection import is_registered_test_id
+    from simc_test.unittests.main import run_unit_test
+    from simc_test.codetests.backends import BACKENDS
+    from simc_test.helpers import TimedCall
+
+    if item["kind"] == "unit" and not is_registered_test_id(item["name"]):
+        details = f"{item['name']} is not a registered unit test"
+        reports = [("error", item["name"], item["name"], details)]
+        return {
+            "type": "result",
+            "key": item_key(item),
+            "reports": reports,
+            "duration": 0.0,
+            "passed": False,
+        }
+
+    if item["kind"] == "unit":
+        reports, duration = run_unit_test(item["name"])
+        return {
+            "type": "result",
+            "key": item_key(item),
+            "reports": reports,
+            "duration": duration,
+            "passed": unit_test_passed(reports),
+        }
+
+    scratch_dir = make_scratch_dir()
+    try:
+        file = os.path.join(scratch_dir, os.path.basename(item["name"]))
+        with open(file, "w") as source_file:
+            source_file.write(item["source"])
+        compile_simc_file = functools.partial(
+            BACKENDS[backend], timeout=item["timeout"], trace_memory=item["trace_memory"]
+        )
+        (_, result), duration = TimedCall(compile_simc_file)(file)
+    finally:
+        remove_dir(scratch_dir)
+
+    return {
+        "type": "result",
+        "key": item_key(item),
+        "result": result,
+        "duration": duration,
+        "passed": code_test_passed(result),
+    }
+
+
+def work(address, jobs=None, backend="inprocess"):
+    # Every job slot keeps one request open, a finished item sends its result together
+    # with the next request so faster workers take more items. The coordinator answers
+    # every request with an item or, once everything is finished, with done
+    if jobs is None:
+        jobs = default_jobs()
+
+    family, sockaddr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.connect(sockaddr)
+    except OSError as e:
+        print(f"\033[91mCould not connect to {address}: {e}\033[m")
+        return False
+    enable_keepalive(sock)
+
+    send_lock = threading.Lock()
+
+    def send(*messages):
+        with send_lock:
+            sock.sendall(b"".join(encode_message(message) for message in messages))
+
+    def item_done(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            # A broken pool cannot run anything else, the coordinator re-queues the leases
+            print(f"\033[91mWorker failed: {e!r}\033[m")
+            sock.shutdown(socket.SHUT_RDWR)
+            os._exit(1)
+        send(result, {"type": "request"})
+
+    num_done = 0
+    futures = []
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    with executor, sock.makefile("rb") as responses:
+        send(*[{"type": "request"}] * jobs)
+        while num_done < jobs:
+            line = responses.readline()
+
+            # The coordinator closes the remaining connections once everything is
+            # finished, which only loses work when items of this worker are still running
+            if not line:
+                if all(future.done() for future in futures):
+                    break
+                print("\033[91mThe coordinator went away\033[m")
+                return False
+
+            message = json.loads(line)
+            if message["type"] == "item":
+                future = executor.submit(run_item, message["item"], backend)
+                future.add_done_callback(item_done)
+                futures.append(future)
+            elif message["type"] == "done":
+                num_done += 1
+
+    sock.close()
+    print(f"\033[92mRan {len(futures)} items for {address}!\033[m")